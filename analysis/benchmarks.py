@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import copy
+import json
+import os
+import pickle
+import time
+import tracemalloc
+
+import pandas as pd
+import numpy as np
+
+from .dynamic_hedging_sims import want_state, update_all, cr_rebal, exposure_rebal, update_exposure, SimulateStrat, SimulateStratBatch
+from .monte_carlo import gbm_paths
+from .risk_metrics import RiskMetrics, strat_metrics
+
+#=========================================#
+# BENCHMARKS
+
+# Functions
+#   Synthetic price feed
+#   Measure time and peak memory
+#   Benchmark helper functions
+#   Benchmark run
+#   Check golden outputs
+#   Check chunked batch metrics
+#   Check profiled copies
+#   Check exposure schedule length
+#   Command line entry point
+
+# NOTE: run with python -m analysis.benchmarks, use --update-golden after an intended change of results
+#=========================================#
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), 'benchmarks_golden.json')
+GOLDEN_KEYS = ['Final', 'Max Total', 'Min Total', 'Max CR', 'Min CR', 'Max Exposure', 'Min Exposure', 'Collateral', 'Exposure', 'Both']
+
+SIZES = {'10k': 10_000, '1M': 1_000_000, '10M': 10_000_000}
+
+# name: (max_cr, min_cr, e_thresh)
+THRESHOLDS = {
+    'tight': (0.62, 0.58, 0.01),
+    'default': (0.65, 0.45, 0.05),
+    'wide': (0.75, 0.35, 0.1)
+}
+
+# Strategy and yields used for every run
+STRAT = {'t': 1000, 'tcr': 0.6, 'te': 0.0}
+YIELDS = {'c_apr': 0.02, 'd_apr': 0.05, 'l_apr': 0.3, 'min_per_step': 1}
+
+
+# Synthetic price feed
+def synthetic_feed(n: int, seed: int=42):
+    rng = np.random.default_rng(seed)
+    return gbm_paths(rng, 1, n, 1.0, YIELDS['min_per_step'], sigma=0.8)[:, 0]
+
+# Measure time and peak memory
+def measure_time(f, *args, **kwargs):
+    t = time.perf_counter()
+    result = f(*args, **kwargs)
+    return result, time.perf_counter() - t
+
+def measure_peak_memory(f, *args, **kwargs):
+    # Traced separately since tracemalloc slows down allocations
+    tracemalloc.start()
+    result = f(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak
+
+# Benchmark helper functions
+def bench_functions(n: int=100_000):
+    c, d, l = want_state(1000, 0.6, 0.0)
+    cases = {
+        'want_state': lambda: want_state(1000, 0.6, 0.0),
+        'update_all': lambda: update_all(c, d, l, 1e-7, 1e-7, 1e-6, 0.001),
+        'cr_rebal': lambda: cr_rebal(c, d, l, 0.6),
+        'exposure_rebal': lambda: exposure_rebal(c, d, l, 0.0),
+        'update_exposure': lambda: update_exposure(c, d, l, 0.1, 0.6)
+    }
+    rows = []
+    for name, f in cases.items():
+        t = time.perf_counter()
+        for _ in range(n):
+            f()
+        elapsed = time.perf_counter() - t
+        rows.append({'benchmark': name, 'calls': n, 'seconds': elapsed, 'calls/sec': n/elapsed})
+    return pd.DataFrame(rows)
+
+# Benchmark run
+def bench_run(sizes: list[str], modes: list[str], thresholds: list[str], max_loop_ticks: int=1_000_000, repeat: int=1, memory: bool=True):
+    rows = []
+    stats = {}
+    for size in sizes:
+        feed = synthetic_feed(SIZES[size])
+        for mode in modes:
+            if mode == 'loop' and SIZES[size] > max_loop_ticks:
+                continue
+            for name in thresholds:
+                max_cr, min_cr, e_thresh = THRESHOLDS[name]
+                run_kwargs = dict(max_cr=max_cr, e_thresh=e_thresh, min_cr=min_cr, mode=mode, **YIELDS)
+                _best = np.inf
+                for _ in range(repeat):
+                    strat = SimulateStrat(**STRAT)
+                    _, elapsed = measure_time(strat.run, feed, **run_kwargs)
+                    _best = min(_best, elapsed)
+                stats['{}/{}'.format(size, name), mode] = strat.sim_stats()
+                peak = measure_peak_memory(SimulateStrat(**STRAT).run, feed, **run_kwargs)[1] if memory == True else np.nan
+                rows.append({'benchmark': 'run', 'size': size, 'mode': mode, 'thresholds': name, 'seconds': _best,
+                             'ticks/sec': SIZES[size]/_best, 'peak MB': peak/2**20})
+    return pd.DataFrame(rows), stats
+
+# Check golden outputs
+def check_golden(stats: dict, update: bool=False, rtol: float=1e-9):
+    golden = {}
+    if os.path.exists(GOLDEN_PATH):
+        with open(GOLDEN_PATH) as f:
+            golden = json.load(f)
+
+    failures = []
+    for (key, mode), s in stats.items():
+        _s = {k: s[k] for k in GOLDEN_KEYS}
+        if update == True:
+            golden[key] = _s
+            continue
+        if key not in golden:
+            continue
+        for k, v in golden[key].items():
+            if not np.isclose(_s[k], v, rtol=rtol, atol=0):
+                failures.append('{} {} {}: {} != golden {}'.format(key, mode, k, _s[k], v))
+
+    if update == True:
+        with open(GOLDEN_PATH, 'w') as f:
+            json.dump(golden, f, indent=2, sort_keys=True)
+    return failures
+
+# Check chunked batch metrics
+def check_metrics(n: int=10_000, metrics_chunk: int=500, rtol: float=1e-9):
+    # Batch metrics updated over many chunks have to match one pass over a full SimulateStrat run
+    feed = synthetic_feed(n)
+    max_cr, min_cr, e_thresh = THRESHOLDS['default']
+    run_kwargs = dict(max_cr=max_cr, e_thresh=e_thresh, min_cr=min_cr, **YIELDS)
+    strat = SimulateStrat(**STRAT)
+    strat.run(feed, **run_kwargs)
+    expected = strat_metrics(strat)
+
+    metrics = RiskMetrics(YIELDS['min_per_step'], min_cr, max_cr)
+    SimulateStratBatch(**STRAT).run(feed, metrics=metrics, metrics_chunk=metrics_chunk, **run_kwargs)
+    failures = []
+    for k, v in metrics.results().items():
+        if not np.isclose(v[0], expected[k], rtol=rtol, atol=0, equal_nan=True):
+            failures.append('metrics chunk {} {}: {} != strat_metrics {}'.format(metrics_chunk, k, v[0], expected[k]))
+    return failures
+
+# Check profiled copies
+def check_profiled_copy(n: int=1_000):
+    # Copies and pickles of a profiled strategy run the plain methods and leave the original profile alone
+    max_cr, min_cr, e_thresh = THRESHOLDS['default']
+    strat = SimulateStrat(**STRAT)
+    profile = strat.enable_profiling()
+    strat.run(synthetic_feed(n), max_cr=max_cr, e_thresh=e_thresh, min_cr=min_cr, **YIELDS)
+    calls = dict(profile.calls)
+
+    failures = []
+    try:
+        _copies = [pickle.loads(pickle.dumps(strat.downsampled())), copy.copy(strat)]
+    except Exception as e:
+        return ['profiled copy: {}'.format(e)]
+    for _strat in _copies:
+        _strat.update_all(0.0, 0.0, 0.0, 0.01)
+    if profile.calls != calls:
+        failures.append('profiled copy: calls on copies were timed in the original profile')
+    if strat.l == _copies[1].l:
+        failures.append('profiled copy: update_all on a copy changed the original strategy')
+    return failures
+
+# Check exposure schedule length
+def check_short_schedule(n: int=1_000):
+    # A schedule shorter than the price changes raises instead of leaving feed rows unwritten
+    max_cr, min_cr, e_thresh = THRESHOLDS['default']
+    feed = synthetic_feed(n)
+    failures = []
+    for mode in ['loop', 'fast']:
+        try:
+            SimulateStrat(**STRAT).run(feed, max_cr=max_cr, e_thresh=e_thresh, min_cr=min_cr, update_exposure=np.zeros(n//2), mode=mode, **YIELDS)
+        except ValueError as e:
+            if 'update_exposure' not in str(e):
+                failures.append('short schedule {}: unexpected error {}'.format(mode, e))
+            continue
+        failures.append('short schedule {}: run did not raise'.format(mode))
+    return failures
+
+# Command line entry point
+def main(argv: list[str]=None):
+    parser = argparse.ArgumentParser(description='Benchmark the simulation hot paths.')
+    parser.add_argument('--sizes', default='10k,1M,10M', help='Comma separated feed sizes ({})'.format(','.join(SIZES)))
+    parser.add_argument('--modes', default='loop,fast', help='Comma separated run modes')
+    parser.add_argument('--thresholds', default=','.join(THRESHOLDS), help='Comma separated threshold settings')
+    parser.add_argument('--max-loop-ticks', type=int, default=1_000_000, help='Skip loop mode above this feed size')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per case, the fastest one is reported')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the traced run that measures peak memory')
+    parser.add_argument('--function-calls', type=int, default=100_000, help='Calls per helper function benchmark')
+    parser.add_argument('--output', default=None, help='Append results to this csv to track them over time')
+    parser.add_argument('--update-golden', action='store_true', help='Overwrite the golden outputs with this run instead of checking them')
+    args = parser.parse_args(argv)
+
+    functions = bench_functions(args.function_calls)
+    print(functions.to_string(index=False))
+    runs, stats = bench_run(args.sizes.split(','), args.modes.split(','), args.thresholds.split(','), args.max_loop_ticks, args.repeat, not args.no_memory)
+    print(runs.to_string(index=False))
+
+    if args.output is not None:
+        results = pd.concat([functions, runs], ignore_index=True)
+        results['timestamp'] = pd.Timestamp.now()
+        results.to_csv(args.output, mode='a', header=not os.path.exists(args.output), index=False)
+
+    failures = check_golden(stats, args.update_golden)
+    for f in failures:
+        print('GOLDEN MISMATCH: '+f)
+    check_failures = check_metrics() + check_profiled_copy() + check_short_schedule()
+    for f in check_failures:
+        print('CHECK FAILED: '+f)
+    failures += check_failures
+    return 1 if len(failures) > 0 else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
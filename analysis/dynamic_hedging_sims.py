@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
 
+import os
+import copy
+import json
+import hashlib
+import time
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import seaborn as sns
 
 #=========================================#
 # SIMULATE STRATEGIES
@@ -17,12 +21,42 @@ import seaborn as sns
 #   Collateral rebalance
 #   Exposure rebalance
 #   Update exposure
+#   Update exposure (vectorized)
+#   Load and save price feeds
 #   run simulation
+#   Percentage change
+#   Rolling return
+#   Profile simulation phases
+#   Downsample for plots
+#   Build parameter grid
+#   run batched simulation
 
 # NOTE: need to work on updating rebal functions to support weigthed pools
 # NOTE: w1 represents the variable token weight
 #=========================================#
 
+# Action codes, ACTION_LABELS[code] gives the action name
+NO_ACTION = 0
+COLLATERAL = 1
+EXPOSURE = 2
+BOTH = 3
+UPDATED_EXPOSURE = 4
+ACTION_LABELS = np.array(['No Action', 'Collateral', 'Exposure', 'Both', 'Updated Exposure'])
+
+# Per tick feeds saved by SimulateStrat.run
+FEEDS = ['c_feed', 'd_feed', 'l_feed', 't_feed', 'cr_feed', 'e_feed', 'updt_cr_feed', 'updt_e_feed', 'te_feed', 'action_feed']
+
+# simdf columns drawn by the plot methods
+PLOT_COLUMNS = ['Total', 'Collateral', 'Debt', 'LP', 'CR', 'Exposure', 'Target Exposure', 'Price']
+
+# Aggregates tracked over every tick by SimulateStrat.run
+AGGREGATES = ['Max Total', 'Min Total', 'Max Drawdown', 'Max CR', 'Min CR', 'Max Exposure', 'Min Exposure', 
+              'Max Daily Return', 'Min Daily Return', 'Max Weekly Return', 'Min Weekly Return']
+
+# SimulateStrat methods timed by enable_profiling, method: phase
+PROFILE_PHASES = {'update_all': 'price update', 'update_exposure': 'update_exposure', 'exposure_rebal': 'exposure_rebal', 
+                  'cr_rebal': 'cr_rebal', '_record': 'record'}
+
 
 # Get want state
 def want_state(t: float, tcr: float, te: float, w: float=0.5):
@@ -158,6 +192,217 @@ def update_exposure(c:float, d: float, l:float, te: float, tcr: float, swapfee:
     
     return c_fnl, d_fnl, l_fnl, _c, _d, _l
 
+# Update exposure (vectorized)
+def update_exposure_vec(c, d, l, te, tcr, swapfee: float=0.0025):
+    """
+    Branch-free version of update_exposure for arrays of strategies.
+
+    c, d, l, te and tcr are broadcast together and each branch of update_exposure becomes
+    a clipped amount or a mask, so strategies where it does not apply add zero. Returns
+    the same values as update_exposure element by element.
+    """
+    
+    c, d, l, te, tcr = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (c, d, l, te, tcr)])
+    
+    # Get new want state given target exposure
+    _t = c - d + l
+    _c, _d, _l = want_state(_t, tcr, te)
+    
+    # remove all liquidity
+    _token1 = l/2
+    _token2 = l/2
+    
+    # Add collateral, swapping token2 for the part token1 is missing
+    _c_add = np.maximum(_c - c, 0)
+    _c_short = (_c_add > 0) & (_token1 < _c_add)
+    _c_missing = np.where(_c_short, _c_add - _token1, 0)
+    c_fnl = np.where(_c_short, c + _token1 + _c_missing*(1-swapfee), c + _c_add)
+    _token1 = np.where(_c_short, 0, _token1 - _c_add)
+    _token2 = _token2 - _c_missing
+    
+    # Repay debt, swapping token1 for the part token2 is missing
+    _d_repay = np.maximum(d - _d, 0)
+    _d_short = (_d_repay > 0) & (_token2 < _d_repay)
+    _d_missing = np.where(_d_short, _d_repay - _token2, 0)
+    d_fnl = np.where(_d_short, d - _token2 - _d_missing*(1-swapfee), d - _d_repay)
+    _token2 = np.where(_d_short, 0, _token2 - _d_repay)
+    _token1 = _token1 - _d_missing
+    
+    # Remove collateral
+    _c_remove = np.maximum(c - _c, 0)
+    c_fnl = c_fnl - _c_remove
+    _token1 = _token1 + _c_remove
+    
+    # Borrow
+    _d_borrow = np.maximum(_d - d, 0)
+    d_fnl = d_fnl + _d_borrow
+    _token2 = _token2 + _d_borrow
+    
+    # Add remaining assets to liquidity pool, half the difference is swapped
+    l_fnl = _token1 + _token2 - np.abs(_token1 - _token2)/2*swapfee
+    
+    return c_fnl, d_fnl, l_fnl, _c, _d, _l
+
+
+
+# Load price feed
+def load_pricefeed(path: str, column: str='close'):
+    """
+    Function loads a price feed without copying it into memory when the format allows it.
+
+    Parameters
+    ----------
+    path : str
+        .npy file (memory-mapped), Arrow IPC/Feather file (memory-mapped, needs pyarrow),
+        Parquet file (needs pyarrow) or csv file.
+    column : str
+        Price column for tabular formats.
+
+    Returns
+    -------
+    prices : np.ndarray
+        Price feed.
+    """
+    
+    _ext = os.path.splitext(path)[1].lower()
+    if _ext == '.npy':
+        return np.load(path, mmap_mode='r')
+    if _ext == '.csv':
+        return pd.read_csv(path, usecols=[column])[column].to_numpy(dtype=float)
+    if _ext in ('.arrow', '.feather', '.ipc', '.parquet'):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('pyarrow is required to load {} price feeds'.format(_ext))
+        if _ext == '.parquet':
+            _col = pq.read_table(path, columns=[column], memory_map=True)[column]
+        else:
+            _col = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()[column]
+        return _col.combine_chunks().to_numpy(zero_copy_only=False)
+    raise ValueError('Unsupported price feed format: {}'.format(_ext))
+
+# Save price feed
+def save_pricefeed(path: str, prices: list[float]):
+    np.save(path, np.asarray(prices, dtype=float))
+
+
+
+# Percentage change
+def pct_change(x, periods: int):
+    """
+    Function returns the percentage change over a number of periods, same as pandas pct_change.
+    """
+    x = np.asarray(x, dtype=float)
+    _r = np.full(len(x), np.nan)
+    if periods < 1:
+        _r[:] = 0.0
+    elif periods < len(x):
+        _r[periods:] = x[periods:]/x[:-periods] - 1
+    return _r
+
+# Downsample for plots
+def lttb(x, y, n_out: int):
+    """
+    Function returns the indices of the points kept by Largest-Triangle-Three-Buckets downsampling.
+
+    Parameters
+    ----------
+    x, y : np.ndarray
+        Series to downsample, x must be increasing.
+    n_out : int
+        Number of points to keep (first and last points are always kept).
+
+    Returns
+    -------
+    idx : np.ndarray
+        Sorted indices of the kept points.
+    """
+    
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    
+    # n_out-2 buckets between the first and last points, with the average of each bucket
+    bounds = np.linspace(1, n-1, n_out-1).astype(int)
+    _counts = np.diff(np.append(bounds, n))
+    _avg_x = np.add.reduceat(x, bounds)/_counts
+    _avg_y = np.add.reduceat(np.nan_to_num(y), bounds)/_counts
+    
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n-1
+    a = 0
+    for i in range(n_out-2):
+        lo, hi = bounds[i], bounds[i+1]
+        
+        # Keep the point making the largest triangle with the last kept point and the next bucket average
+        _area = np.abs((x[a] - _avg_x[i+1])*(y[lo:hi] - y[a]) - (x[a] - x[lo:hi])*(_avg_y[i+1] - y[a]))
+        a = lo + int(np.argmax(np.nan_to_num(_area, nan=-1.0)))
+        idx[i+1] = a
+    return idx
+
+
+
+# Rolling return
+class RollingReturn:
+    """
+    Return over a fixed number of periods computed from a ring buffer of past values.
+
+    Gives the same values as pandas pct_change(periods) one value at a time, using
+    O(periods) memory no matter how many values are pushed.
+    """
+    
+    def __init__(self, periods: int):
+        self.periods = periods
+        self.buffer = np.empty(max(periods, 1))
+        self.count = 0
+        
+    def update(self, value: float):
+        if self.periods < 1:
+            return 0.0
+        i = self.count % self.periods
+        _r = value/self.buffer[i] - 1 if self.count >= self.periods else np.nan
+        self.buffer[i] = value
+        self.count += 1
+        return _r
+
+# Profile simulation phases
+class SimProfile:
+    """
+    Time and call counts per simulation phase, filled by SimulateStrat.enable_profiling.
+    """
+    
+    def __init__(self):
+        self.reset()
+        
+    def reset(self):
+        self.calls = dict.fromkeys(PROFILE_PHASES.values(), 0)
+        self.seconds = dict.fromkeys(PROFILE_PHASES.values(), 0.0)
+        
+    def wrap(self, phase: str, f):
+        calls = self.calls
+        seconds = self.seconds
+        perf_counter = time.perf_counter
+        def timed(*args, **kwargs):
+            _t = perf_counter()
+            result = f(*args, **kwargs)
+            seconds[phase] += perf_counter() - _t
+            calls[phase] += 1
+            return result
+        return timed
+    
+    def stats(self):
+        """
+        DataFrame with calls, total seconds, microseconds per call and share of the profiled time per phase.
+        """
+        stats = pd.DataFrame({'calls': self.calls, 'seconds': self.seconds})
+        stats['us/call'] = 1e6*stats['seconds']/stats['calls'].where(stats['calls'] > 0)
+        stats['share'] = stats['seconds']/stats['seconds'].sum() if stats['seconds'].sum() > 0 else 0.0
+        return stats
+    
+    def __repr__(self):
+        return self.stats().to_string()
+
 
 
 class SimulateStrat:
@@ -175,6 +420,8 @@ class SimulateStrat:
         self.c = _c
         self.d = _d
         self.l = _l
+        self._simdf = None
+        self.profile = None
                 
     def reset_strat(self, t: float):
         _c, _d, _l = self.want_state(t)
@@ -191,6 +438,11 @@ class SimulateStrat:
     def get_total(self):
         return self.c-self.d+self.l
     
+    @property
+    def pricechange(self):
+        _p = np.asarray(self.pricefeed, dtype=float)
+        return np.insert(np.diff(_p) / np.abs(_p[:-1]), 0, 0)
+    
     def update_all(self, rc: float, rd: float, rl: float, p1_chg: float, p2_chg: float=0):
          _c, _d, _l = update_all(self.c, self.d, self.l, rc, rd, rl, p1_chg, p2_chg, self.w1, self.w2)
          self.c = _c
@@ -216,7 +468,273 @@ class SimulateStrat:
         self.d = d_fnl
         self.l = l_fnl
 
-    def run(self, pricefeed: list[float], c_apr: float, d_apr: float, l_apr: float, min_per_step: float, max_cr: float, e_thresh: float, min_cr: float, update_exposure: list[float]=[]):
+    def enable_profiling(self):
+        """
+        Times every call of the PROFILE_PHASES methods and returns the SimProfile collecting them.
+
+        The timed wrappers are set on the instance only, so strategies without profiling run
+        the plain methods at no extra cost, copies and pickles of the strategy are not profiled.
+        In fast mode only the action ticks are stepped through these methods, the closed-form
+        segments between them are not profiled.
+        """
+        self.profile = SimProfile()
+        for name, phase in PROFILE_PHASES.items():
+            setattr(self, name, self.profile.wrap(phase, getattr(type(self), name).__get__(self)))
+        return self.profile
+    
+    def disable_profiling(self):
+        # Drop the instance wrappers, profile keeps the collected stats
+        for name in PROFILE_PHASES:
+            self.__dict__.pop(name, None)
+    
+    def __getstate__(self):
+        # Copies and pickles run the plain methods, the timing wrappers are bound to this instance
+        state = self.__dict__.copy()
+        for name in PROFILE_PHASES:
+            state.pop(name, None)
+        return state
+
+    def _step(self, c_yield: float, d_yield: float, l_yield: float, p: float, u: float, max_cr: float, e_thresh: float, min_cr: float):
+        # Update state with given price change
+        self.update_all(c_yield, d_yield, l_yield, p)
+        _cr, _e = self.get_state()
+        cr, e = _cr, _e
+        
+        # Check if exposure needs to be updated
+        u_rebal = False
+        if u != self.te:
+            self.update_exposure(u)
+            u_rebal = True
+            _cr, _e = self.get_state()
+        
+        # Check if exposure needs to be rebalanced
+        e_rebal = False
+        if abs(self.te - _e) > e_thresh:
+            self.exposure_rebal()
+            e_rebal = True
+            _cr, _e = self.get_state()
+            
+        # Check if collateral needs to be rebalanced
+        cr_rebal = False
+        if _cr > max_cr or _cr < min_cr:
+            self.cr_rebal()
+            cr_rebal = True
+            
+        if e_rebal == True and cr_rebal == True:
+            action = BOTH
+        elif u_rebal == True:
+            action = UPDATED_EXPOSURE
+        elif e_rebal == True:
+            action = EXPOSURE
+        elif cr_rebal == True:
+            action = COLLATERAL
+        else:
+            action = NO_ACTION
+        return cr, e, action
+
+    def _record(self, i: int, cr: float, e: float, action: int):
+        _cr, _e = self.get_state()
+        self.c_feed[i] = self.c
+        self.d_feed[i] = self.d
+        self.l_feed[i] = self.l
+        self.t_feed[i] = self.get_total()
+        self.cr_feed[i] = cr
+        self.e_feed[i] = e
+        self.updt_cr_feed[i] = _cr
+        self.updt_e_feed[i] = _e
+        self.te_feed[i] = self.te
+        self.action_feed[i] = action
+
+    def _run_fast(self, pricechange, update_exposure, c_yield: float, d_yield: float, l_yield: float, max_cr: float, e_thresh: float, min_cr: float, offset: int=0):
+        """
+        Event-skipping version of the run loop.
+
+        Between actions the positions follow closed-form multiplicative updates, so each
+        no-action segment is computed with cumulative products and only the tick where the
+        exposure threshold, the min/max CR or the exposure schedule triggers is stepped as a scalar.
+        Feeds are written starting after index offset.
+        """
+        n = len(pricechange)
+        
+        # Cumulative price growth, state i is reached after applying pricechange[i-1]
+        growth = np.concatenate(([1.0], np.cumprod(1 + pricechange)))
+        update_exposure = np.asarray(update_exposure, dtype=float)
+        
+        s = 0
+        window = 256
+        while s < n:
+            # Closed-form positions for the ticks following anchor s
+            _end = min(s + window, n)
+            _k = np.arange(1, _end - s + 1)
+            _r = growth[s+1:_end+1]/growth[s]
+            _c = self.c*(1+c_yield)**_k
+            _d = self.d*(1+d_yield)**_k*_r
+            _l = self.l*(1+l_yield)**_k*_r**self.w1
+            _cr, _e = get_state(_c, _d, _l, self.w1)
+            
+            # First tick where the loop would take an action
+            _trigger = (update_exposure[s:_end] != self.te) | (np.abs(self.te - _e) > e_thresh) | (_cr > max_cr) | (_cr < min_cr)
+            _hits = np.flatnonzero(_trigger)
+            _m = _hits[0] if len(_hits) > 0 else _end - s
+            
+            # Fill no-action segment
+            seg = slice(offset+s+1, offset+s+1+_m)
+            self.c_feed[seg], self.d_feed[seg], self.l_feed[seg] = _c[:_m], _d[:_m], _l[:_m]
+            self.t_feed[seg] = _c[:_m] - _d[:_m] + _l[:_m]
+            self.cr_feed[seg] = self.updt_cr_feed[seg] = _cr[:_m]
+            self.e_feed[seg] = self.updt_e_feed[seg] = _e[:_m]
+            self.te_feed[seg] = self.te
+            self.action_feed[seg] = NO_ACTION
+            if _m > 0:
+                self.c, self.d, self.l = _c[_m-1], _d[_m-1], _l[_m-1]
+            s += _m
+            
+            if len(_hits) == 0:
+                window = min(2*window, 65536)
+                continue
+            window = max(256, 2*_m)
+            
+            # Scalar step at the action tick
+            cr, e, action = self._step(c_yield, d_yield, l_yield, pricechange[s], update_exposure[s], max_cr, e_thresh, min_cr)
+            s += 1
+            self._record(offset+s, cr, e, action)
+
+    def _alloc_feeds(self, n: int, checkpoint_dir: str=None, resume: bool=False):
+        # In memory feeds
+        if checkpoint_dir is None:
+            for k in FEEDS:
+                setattr(self, k, np.empty(n, dtype=np.int8 if k == 'action_feed' else float))
+            return
+        
+        # Memory-mapped feeds
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        for k in FEEDS:
+            _path = os.path.join(checkpoint_dir, k+'.npy')
+            if resume == True:
+                _f = np.load(_path, mmap_mode='r+')
+            else:
+                _f = np.lib.format.open_memmap(_path, mode='w+', dtype=np.int8 if k == 'action_feed' else float, shape=(n,))
+            setattr(self, k, _f)
+    
+    def _init_aggregates(self, min_per_step: float):
+        self.aggregates = {k: np.nan for k in AGGREGATES}
+        self.aggregates['Max Drawdown'] = 0.0
+        self.action_counts = np.zeros(len(ACTION_LABELS), dtype=np.int64)
+        self._periods = (int(24*60/min_per_step), int(7*24*60/min_per_step))
+        self._tail = np.empty(0)
+        self._peak = -np.inf
+        self._events = []
+    
+    def _update_aggregates(self, lo: int, hi: int, tick: int, record: str, snapshot_every: int, last: bool=False):
+        """
+        Updates the run aggregates with feed rows lo to hi (tick is the tick of row lo) and,
+        when recording events, keeps the rows with an action, on a snapshot tick or the last one.
+        """
+        _t = self.t_feed[lo:hi]
+        _agg = self.aggregates
+        for name, x in [('Total', _t), ('CR', self.cr_feed[lo:hi]), ('Exposure', self.e_feed[lo:hi])]:
+            _agg['Max '+name] = np.nanmax([_agg['Max '+name], np.nanmax(x)])
+            _agg['Min '+name] = np.nanmin([_agg['Min '+name], np.nanmin(x)])
+        
+        # Drawdown continues from the previous peak
+        _peak = np.maximum.accumulate(np.concatenate(([self._peak], _t)))[1:]
+        _agg['Max Drawdown'] = max(_agg['Max Drawdown'], np.max(1 - _t/_peak))
+        self._peak = _peak[-1]
+        
+        # Rolling returns continue from the tail of previous totals
+        _x = np.concatenate((self._tail, _t))
+        for name, k in zip(['Daily', 'Weekly'], self._periods):
+            _start = max(len(self._tail), k)
+            if k < 1 or _start >= len(_x):
+                continue
+            _r = _x[_start:]/_x[_start-k:len(_x)-k] - 1
+            _agg['Max {} Return'.format(name)] = np.nanmax([_agg['Max {} Return'.format(name)], np.nanmax(_r)])
+            _agg['Min {} Return'.format(name)] = np.nanmin([_agg['Min {} Return'.format(name)], np.nanmin(_r)])
+        self._tail = _x[-max(max(self._periods), 1):]
+        
+        self.action_counts += np.bincount(self.action_feed[lo:hi], minlength=len(ACTION_LABELS))
+        
+        # Keep event and snapshot rows
+        if record == 'events':
+            _ticks = np.arange(tick, tick + hi - lo)
+            _keep = self.action_feed[lo:hi] != NO_ACTION
+            if snapshot_every:
+                _keep |= _ticks % snapshot_every == 0
+            _keep[0] |= tick == 0
+            _keep[-1] |= last
+            _rows = {'index_feed': _ticks[_keep]}
+            for k in FEEDS:
+                _rows[k] = getattr(self, k)[lo:hi][_keep]
+            self._events.append(_rows)
+    
+    def _inputs_hash(self, prices: np.ndarray, update_exposure: list[float], chunk: int):
+        # Hash of the price feed and exposure schedule, read chunk ticks at a time so memory-mapped feeds are not loaded whole
+        h = hashlib.blake2b(digest_size=20)
+        for s in range(0, len(prices), chunk):
+            h.update(np.ascontiguousarray(prices[s:s+chunk], dtype=np.float64))
+        h.update(b'|')
+        h.update(np.ascontiguousarray(update_exposure, dtype=np.float64))
+        return h.hexdigest()
+    
+    def _load_checkpoint(self, checkpoint_dir: str, params: dict):
+        _path = os.path.join(checkpoint_dir, 'checkpoint.json')
+        if not os.path.exists(_path):
+            return None
+        with open(_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint['params'] != params:
+            raise ValueError('Checkpoint in {} was saved for different run params'.format(checkpoint_dir))
+        
+        self.c, self.d, self.l, self.te = checkpoint['c'], checkpoint['d'], checkpoint['l'], checkpoint['te']
+        self.aggregates = checkpoint['aggregates']
+        with np.load(os.path.join(checkpoint_dir, 'aggregates.npz')) as f:
+            self.action_counts = f['action_counts']
+            self._tail = f['tail']
+            self._peak = float(f['peak'])
+            if params['record'] == 'events':
+                self._events = [{k: f[k] for k in ['index_feed']+FEEDS}]
+        return checkpoint['offset']
+    
+    def _save_checkpoint(self, checkpoint_dir: str, offset: int, params: dict):
+        _events = {}
+        if params['record'] == 'full':
+            for k in FEEDS:
+                getattr(self, k).flush()
+        else:
+            _events = {k: np.concatenate([r[k] for r in self._events]) for k in ['index_feed']+FEEDS}
+            self._events = [_events]
+        np.savez(os.path.join(checkpoint_dir, 'aggregates.tmp.npz'), action_counts=self.action_counts, tail=self._tail, peak=self._peak, **_events)
+        os.replace(os.path.join(checkpoint_dir, 'aggregates.tmp.npz'), os.path.join(checkpoint_dir, 'aggregates.npz'))
+        
+        checkpoint = {'offset': offset, 'c': float(self.c), 'd': float(self.d), 'l': float(self.l), 'te': float(self.te), 
+                      'aggregates': {k: float(v) for k, v in self.aggregates.items()}, 'params': params}
+        _path = os.path.join(checkpoint_dir, 'checkpoint.json')
+        with open(_path+'.tmp', 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(_path+'.tmp', _path)
+
+    def run(self, pricefeed: list[float], c_apr: float, d_apr: float, l_apr: float, min_per_step: float, max_cr: float, e_thresh: float, min_cr: float, update_exposure: list[float]=[], 
+            mode: str='loop', checkpoint_dir: str=None, checkpoint_every: int=1000000, record: str='full', snapshot_every: int=None):
+        """
+        Runs the strategy over a price feed and saves the state after every tick in the feeds and simdf.
+
+        pricefeed can be a list or an array, including a memory-mapped one from load_pricefeed.
+        Price changes are computed checkpoint_every ticks at a time so the feed is never copied.
+        When checkpoint_dir is given, feeds are memory-mapped .npy files in that directory and
+        the strategy state is saved every checkpoint_every ticks. Calling run again with the
+        same checkpoint_dir, params, feeds and initial state resumes from the last checkpoint,
+        any other change raises a ValueError.
+
+        With record='events' the feeds only keep the first and last ticks, ticks with an action
+        and every snapshot_every-th tick (index_feed gives their tick). Totals, CR, exposure,
+        drawdown, daily/weekly returns and action counts are still aggregated over every tick
+        in aggregates and action_counts.
+        """
+        
+        if mode not in ('loop', 'fast'):
+            raise ValueError("mode must be 'loop' or 'fast'")
+        if record not in ('full', 'events'):
+            raise ValueError("record must be 'full' or 'events'")
         
         # Get yield per step
         steps_per_year = 365*24*60/min_per_step
@@ -224,111 +742,102 @@ class SimulateStrat:
         d_yield = d_apr/steps_per_year
         l_yield = l_apr/steps_per_year
         
-        # Get price percentage change
-        pricechange = np.array(pricefeed)
-        pricechange = np.diff(pricechange) / np.abs(pricechange[:-1])
+        prices = np.asarray(pricefeed, dtype=float)
+        n = len(prices)
+        if len(update_exposure) == n:
+            update_exposure = update_exposure[1:]
+        if len(update_exposure) not in (0, n-1):
+            raise ValueError('update_exposure must have {} or {} entries (one per tick or per price change), got {}'.format(n, n-1, len(update_exposure)))
+        
+        # Preallocate feeds, recording events only needs one chunk at a time
+        if checkpoint_dir is not None:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+        params = {'n': n, 'tcr': self.tcr, 'w1': self.w1, 'w2': self.w2, 'swapfee': self.swapfee, 'c_apr': c_apr, 'd_apr': d_apr, 'l_apr': l_apr, 
+                  'min_per_step': min_per_step, 'max_cr': max_cr, 'e_thresh': e_thresh, 'min_cr': min_cr, 'mode': mode, 'checkpoint_every': checkpoint_every,
+                  'record': record, 'snapshot_every': snapshot_every}
+        if checkpoint_dir is not None:
+            # Resuming needs the same inputs and initial state
+            params.update({'inputs': self._inputs_hash(prices, update_exposure, checkpoint_every), 
+                           'c': float(self.c), 'd': float(self.d), 'l': float(self.l), 'te': float(self.te)})
+        self._init_aggregates(min_per_step)
+        start = None if checkpoint_dir is None else self._load_checkpoint(checkpoint_dir, params)
+        if record == 'full':
+            self._alloc_feeds(n, checkpoint_dir, resume=start is not None)
+        else:
+            self._alloc_feeds(min(checkpoint_every, n-1)+1)
         
         # Save initial state
-        _cr, _e = self.get_state()
-        c_feed = [self.c]
-        d_feed = [self.d]
-        l_feed = [self.l]
-        t_feed = [self.get_total()]
-        cr_feed = [_cr]
-        e_feed = [_e]
-        updt_cr_feed = [_cr]
-        updt_e_feed = [_e]
-        action_feed = ['No Action']
-        te_feed = [self.te]
-
-        if len(update_exposure) == 0:
-            update_exposure = [self.te]*len(pricechange)
-        elif len(update_exposure) == len(pricechange)+1:
-            update_exposure.pop(0)
-        
-        for p, u in zip(pricechange, update_exposure):
-            # Update state with given price change
-            self.update_all(c_yield, d_yield, l_yield, p)
+        if start is None:
+            start = 0
             _cr, _e = self.get_state()
-            cr_feed.append(_cr)
-            e_feed.append(_e)
-            
-            # Check if exposure needs to be updated
-            u_rebal = False
-            if u != self.te:
-                self.update_exposure(u)
-                u_rebal = True
-                _cr, _e = self.get_state()
+            self._record(0, _cr, _e, NO_ACTION)
+            self._update_aggregates(0, 1, 0, record, snapshot_every, last=n == 1)
+        te = self.te
+        
+        for s in range(start, n-1, checkpoint_every):
+            # Get price percentage change
+            e = min(s + checkpoint_every, n-1)
+            pricechange = np.diff(prices[s:e+1]) / np.abs(prices[s:e])
+            _u = update_exposure[s:e] if len(update_exposure) > 0 else np.full(e-s, te)
             
-            # Check if exposure needs to be rebalanced
-            e_rebal = False
-            if abs(self.te - _e) > e_thresh:
-                self.exposure_rebal()
-                e_rebal = True
-                _cr, _e = self.get_state()
-                
-            # Check if collateral needs to be rebalanced
-            cr_rebal = False
-            if _cr > max_cr or _cr < min_cr:
-                self.cr_rebal()
-                cr_rebal = True
-                
-            # Save state
-            _cr, _e = self.get_state()
-            c_feed.append(self.c)
-            d_feed.append(self.d)
-            l_feed.append(self.l)
-            t_feed.append(self.get_total())
-            updt_cr_feed.append(_cr)
-            updt_e_feed.append(_e)
-            te_feed.append(self.te)
-            if e_rebal == True and cr_rebal == True:
-                action = 'Both'
-            elif u_rebal == True:
-                action = 'Updated Exposure'
-            elif e_rebal == True:
-                action = 'Exposure'
-            elif cr_rebal == True:
-                action = 'Collateral'
+            # Feed row of tick s
+            o = s if record == 'full' else 0
+            if mode == 'fast':
+                self._run_fast(pricechange, _u, c_yield, d_yield, l_yield, max_cr, e_thresh, min_cr, offset=o)
             else:
-                action = 'No Action'
-            action_feed.append(action)
-        
-        # Save feeds
-        self.c_feed = c_feed
-        self.d_feed = d_feed
-        self.l_feed = l_feed
-        self.t_feed = t_feed
-        self.cr_feed = cr_feed
-        self.e_feed = e_feed
-        self.updt_cr_feed = updt_cr_feed
-        self.updt_e_feed = updt_e_feed
-        self.action_feed = action_feed
+                for i, (p, u) in enumerate(zip(pricechange, _u)):
+                    _cr, _e, action = self._step(c_yield, d_yield, l_yield, p, u, max_cr, e_thresh, min_cr)
+                    self._record(o+i+1, _cr, _e, action)
+            
+            self._update_aggregates(o+1, o+e-s+1, s+1, record, snapshot_every, last=e == n-1)
+            
+            if checkpoint_dir is not None:
+                self._save_checkpoint(checkpoint_dir, e, params)
+        
         self.pricefeed = pricefeed
-        self.pricechange = np.insert(pricechange, 0, 0).tolist()
-        self.te_feed = te_feed
+        self.index_feed = None
+        self._simdf = None
         
-        # Feeds to df
-        self.simdf = pd.DataFrame({
-            'Collateral': c_feed,
-            'Debt': d_feed,
-            'LP': l_feed,
-            'Total': t_feed,
-            'CR': cr_feed,
-            'Exposure': e_feed,
-            'Updated CR': updt_cr_feed,
-            'Updated Exposure': updt_e_feed,
-            'Action': action_feed,
-            'Price': pricefeed,
-            'Price Change': self.pricechange,
-            'Target Exposure': self.te_feed
-        }).reset_index()
+        # Event rows become the feeds
+        if record == 'events':
+            _events = self._events
+            for k in ['index_feed']+FEEDS:
+                setattr(self, k, np.concatenate([r[k] for r in _events]))
+        
+        # Save sim params
+        self.min_per_step = min_per_step
+        self.max_cr = max_cr
+        self.e_thresh = e_thresh
+        self.min_cr = min_cr
+        
+    def stream(self, ticks, c_apr: float, d_apr: float, l_apr: float, min_per_step: float, max_cr: float, e_thresh: float, min_cr: float):
+        """
+        Generator version of run that takes prices one at a time.
+
+        Parameters
+        ----------
+        ticks : iterable
+            Prices, or (price, target exposure) tuples to follow an exposure schedule.
+            The first tick sets the initial price.
+        c_apr, d_apr, l_apr, min_per_step, max_cr, e_thresh, min_cr : float
+            Same as run.
+
+        Yields
+        ------
+        state : dict
+            Same fields as a simdf row, with the action label and the daily and weekly
+            returns from fixed-size ring buffers. No history is kept.
+        """
+        
+        # Get yield per step
+        steps_per_year = 365*24*60/min_per_step
+        c_yield = c_apr/steps_per_year
+        d_yield = d_apr/steps_per_year
+        l_yield = l_apr/steps_per_year
         
         # Daily and weekly returns
-        periods_per_day = 24*60/min_per_step
-        self.simdf['daily_return'] = self.simdf['Total'].pct_change(int(periods_per_day))
-        periods_per_week = 7*24*60/min_per_step
-        self.simdf['weekly_return'] = self.simdf['Total'].pct_change(int(periods_per_week))
+        daily_return = RollingReturn(int(24*60/min_per_step))
+        weekly_return = RollingReturn(int(7*24*60/min_per_step))
         
         # Save sim params
         self.min_per_step = min_per_step
@@ -336,81 +845,201 @@ class SimulateStrat:
         self.e_thresh = e_thresh
         self.min_cr = min_cr
         
+        prev_price = None
+        for i, tick in enumerate(ticks):
+            price, u = tick if isinstance(tick, tuple) else (tick, self.te)
+            if prev_price is None:
+                # Initial state
+                p = 0.0
+                _cr, _e = self.get_state()
+                action = NO_ACTION
+            else:
+                p = (price - prev_price)/abs(prev_price)
+                _cr, _e, action = self._step(c_yield, d_yield, l_yield, p, u, max_cr, e_thresh, min_cr)
+            prev_price = price
+            
+            _t = self.get_total()
+            _ucr, _ue = self.get_state()
+            yield {
+                'index': i,
+                'Collateral': self.c,
+                'Debt': self.d,
+                'LP': self.l,
+                'Total': _t,
+                'CR': _cr,
+                'Exposure': _e,
+                'Updated CR': _ucr,
+                'Updated Exposure': _ue,
+                'Action': str(ACTION_LABELS[action]),
+                'Price': price,
+                'Price Change': p,
+                'Target Exposure': self.te,
+                'daily_return': daily_return.update(_t),
+                'weekly_return': weekly_return.update(_t)
+            }
+        
+    @property
+    def simdf(self):
+        """
+        DataFrame of the feeds saved by run, built on first access.
+        """
+        if self._simdf is None:
+            self._simdf = self._build_simdf()
+        return self._simdf
+    
+    def _build_simdf(self):
+        prices = np.asarray(self.pricefeed, dtype=float)
+        if self.index_feed is None:
+            _idx = np.arange(len(self.t_feed))
+            _pricechange = self.pricechange
+        else:
+            _idx = self.index_feed
+            _prev = prices[np.maximum(_idx-1, 0)]
+            _pricechange = (prices[_idx] - _prev)/np.abs(_prev)
+        
+        # Feeds to df
+        simdf = pd.DataFrame({
+            'index': _idx,
+            'Collateral': self.c_feed,
+            'Debt': self.d_feed,
+            'LP': self.l_feed,
+            'Total': self.t_feed,
+            'CR': self.cr_feed,
+            'Exposure': self.e_feed,
+            'Updated CR': self.updt_cr_feed,
+            'Updated Exposure': self.updt_e_feed,
+            'Action': pd.Categorical.from_codes(self.action_feed, ACTION_LABELS),
+            'Price': prices[_idx],
+            'Price Change': _pricechange,
+            'Target Exposure': self.te_feed
+        })
+        
+        # Daily and weekly returns, only meaningful when every tick is recorded
+        if self.index_feed is None:
+            periods_per_day = 24*60/self.min_per_step
+            simdf['daily_return'] = pct_change(self.t_feed, int(periods_per_day))
+            periods_per_week = 7*24*60/self.min_per_step
+            simdf['weekly_return'] = pct_change(self.t_feed, int(periods_per_week))
+        return simdf
+    
+    def sim_stats(self):
+        """
+        Function returns the statistics of the last run as a dict, computed from the feeds and aggregates.
+        """
+        initial_value = float(self.t_feed[0])
+        final_value = float(self.t_feed[-1])
+        total_days = self.min_per_step*len(self.pricefeed)/(60*24)
+        total_return = final_value - initial_value
+        
+        stats = {
+            'Initial': initial_value,
+            'Final': final_value,
+            'Total Days': total_days,
+            'Return': total_return/initial_value,
+            'Total Return': total_return,
+            'Annualized Return': 365*(total_return/total_days)/initial_value
+        }
+        stats.update({k: float(v) for k, v in self.aggregates.items()})
+        for a in [COLLATERAL, EXPOSURE, BOTH, UPDATED_EXPOSURE]:
+            stats[str(ACTION_LABELS[a])] = int(self.action_counts[a])
+        return stats
+        
     def print_sim_stats(self):
-        initial_value = self.t_feed[0]
-        final_value = self.t_feed[-1]
+        stats = self.sim_stats()
         
         print('\n----------------------Strategy Total----------------------')
-        print('Strategy Initial: ${0:.2f}'.format(initial_value))
-        print('Strategy Final: ${0:.2f}'.format(final_value))
-        print('Strategy Max: ${0:.2f}'.format(max(self.t_feed)))
-        print('Strategy Min: ${0:.2f}'.format(min(self.t_feed)))
+        print('Strategy Initial: ${0:.2f}'.format(stats['Initial']))
+        print('Strategy Final: ${0:.2f}'.format(stats['Final']))
+        print('Strategy Max: ${0:.2f}'.format(stats['Max Total']))
+        print('Strategy Min: ${0:.2f}'.format(stats['Min Total']))
         
         print('\n--------------------Strategy Timeframe--------------------')
-        total_days = self.min_per_step*len(self.pricefeed)/(60*24)
-        print('Total time in days: {}'.format(total_days))
+        print('Total time in days: {}'.format(stats['Total Days']))
         
         print('\n--------------------Strategy Returns--------------------')
-        total_return = final_value - initial_value
-        yearly_return = 365*(total_return/total_days)/initial_value
-        print('Return: {0:.3f}%'.format(100*total_return/initial_value))  
-        print('Total Return: ${0:.5f}'.format(total_return))        
-        print('Annualized Return: {0:.3f}%'.format(100*yearly_return)) 
-        print('Max Daily Return: {0:.3f}%'.format(100*self.simdf['daily_return'].max())) 
-        print('Min Daily Return: {0:.3f}%'.format(100*self.simdf['daily_return'].min()))         
-        print('Max Weekly Return: {0:.3f}%'.format(100*self.simdf['weekly_return'].max())) 
-        print('Min Weekly Return: {0:.3f}%'.format(100*self.simdf['weekly_return'].min()))  
+        print('Return: {0:.3f}%'.format(100*stats['Return']))  
+        print('Total Return: ${0:.5f}'.format(stats['Total Return']))        
+        print('Annualized Return: {0:.3f}%'.format(100*stats['Annualized Return'])) 
+        print('Max Daily Return: {0:.3f}%'.format(100*stats['Max Daily Return'])) 
+        print('Min Daily Return: {0:.3f}%'.format(100*stats['Min Daily Return']))         
+        print('Max Weekly Return: {0:.3f}%'.format(100*stats['Max Weekly Return'])) 
+        print('Min Weekly Return: {0:.3f}%'.format(100*stats['Min Weekly Return']))  
 
         print('\n---------------------Strategy Params----------------------')
-        print('Max Collateral Ratio: {0:.2f}'.format(max(self.cr_feed)))
-        print('Max Exposure: {0:.2f}'.format(max(self.e_feed)))
-        print('Min Collateral Ratio: {0:.2f}'.format(min(self.cr_feed)))
-        print('Min Exposure: {0:.2f}'.format(min(self.e_feed)))   
+        print('Max Collateral Ratio: {0:.2f}'.format(stats['Max CR']))
+        print('Max Exposure: {0:.2f}'.format(stats['Max Exposure']))
+        print('Min Collateral Ratio: {0:.2f}'.format(stats['Min CR']))
+        print('Min Exposure: {0:.2f}'.format(stats['Min Exposure']))   
         
         print('\n---------------------Strategy Actions----------------------')
-        print('Count of Collateral Rebalance: {}'.format(sum([x == 'Collateral' for x in self.action_feed])))
-        print('Count of Exposure Rebalance: {}'.format(sum([x == 'Exposure' for x in self.action_feed])))
-        print('Count of Both Rebalance: {}'.format(sum([x == 'Both' for x in self.action_feed])))
-        print('Count of Exposure Update: {}'.format(sum([x == 'Updated Exposure' for x in self.action_feed])))
+        print('Count of Collateral Rebalance: {}'.format(stats['Collateral']))
+        print('Count of Exposure Rebalance: {}'.format(stats['Exposure']))
+        print('Count of Both Rebalance: {}'.format(stats['Both']))
+        print('Count of Exposure Update: {}'.format(stats['Updated Exposure']))
         
-    def plot_totals(self, include_positions: bool = False, save_fig: bool = False):      
+    def _plot_df(self, max_points: int, columns: list[str]):
+        # Downsampled copy of simdf, simdf itself is never modified by the plots
         df = self.simdf
+        if max_points is None or len(df) <= max_points:
+            return df
+        _x = df['index'].to_numpy(dtype=float)
+        _keep = [np.flatnonzero(df['Action'].cat.codes.to_numpy() != NO_ACTION)]
+        for col in columns:
+            _keep.append(lttb(_x, df[col].to_numpy(dtype=float), max_points))
+        return df.iloc[np.unique(np.concatenate(_keep))]
+    
+    def _save_or_show(self, fig, save_fig: bool, filename: str):
+        if save_fig ==  False:
+            plt.show()    
+        else:
+            fig.savefig(filename)
+            plt.close(fig)
+    
+    def downsampled(self, max_points: int=5000):
+        """
+        Returns a copy of the strategy that only holds a downsampled simdf, small enough to
+        send to plotting worker processes. Feeds are not copied.
+        """
+        strat = copy.copy(self)
+        strat._simdf = self._plot_df(max_points, PLOT_COLUMNS)
+        for k in ['pricefeed', 'index_feed']+FEEDS:
+            setattr(strat, k, None)
+        return strat
+        
+    def plot_totals(self, include_positions: bool = False, save_fig: bool = False, max_points: int = 5000, filename: str = 'sim_totals.png'):      
+        df = self._plot_df(max_points, ['Total', 'Collateral', 'Debt', 'LP'] if include_positions == True else ['Total'])
         
         # Plot
         fig, ax = plt.subplots()
         fig.set_size_inches(20,10)
         
-        ax.plot(df['Total'], color = 'black', label = 'Total Value' )
+        ax.plot(df['index'], df['Total'], color = 'black', label = 'Total Value' )
         ax.legend(loc = 'lower left')
         ax.set_ylabel('Strategy Total Value')
         
         if include_positions == True:
             ax2 = ax.twinx()
-            ax2.plot(df['Collateral'], color = 'blue', label = 'Collateral')
-            ax2.plot(df['Debt'], color = 'red', label = 'Debt')
-            ax2.plot(df['LP'], color = 'green', label = 'LP')
+            ax2.plot(df['index'], df['Collateral'], color = 'blue', label = 'Collateral')
+            ax2.plot(df['index'], df['Debt'], color = 'red', label = 'Debt')
+            ax2.plot(df['index'], df['LP'], color = 'green', label = 'LP')
             ax2.ticklabel_format(useOffset=False, style='plain')
             ax2.legend(loc = 'lower right')
             ax2.set_ylabel('Positions Value')
         
-        if save_fig ==  False:
-            plt.show()    
-        else:
-            plt.savefig('sim_totals.png')
-        
-    def plot_totals_with_rebalance_points(self, save_fig: bool = False):
-        df = self.simdf
+        self._save_or_show(fig, save_fig, filename)
         
-        # Create rebalance points to plot
-        df['rebal_plot'] = np.where(df['Action'] == 'No Action', np.nan, df['Total'])
+    def plot_totals_with_rebalance_points(self, save_fig: bool = False, max_points: int = 5000, filename: str = 'sim_with_rebal.png'):
+        df = self._plot_df(max_points, ['Total', 'Price'])
 
         # Plot        
         fig, ax = plt.subplots()
         fig.set_size_inches(20,10)
         
         ax.plot('index', 'Total', data=df, color = 'black', label = 'Total Value', alpha=0.75)
-        color_palette = {"Collateral":"blue", "Exposure":"orange", "Both":"purple", "No Action":"white", "Updated Exposure":"red"}
-        sns.scatterplot(x='index', y='rebal_plot', data=df, hue="Action", ax=ax, palette=color_palette, s=100)
+        color_palette = {"Collateral":"blue", "Exposure":"orange", "Both":"purple", "Updated Exposure":"red"}
+        for action, color in color_palette.items():
+            _points = df[df['Action'] == action]
+            ax.scatter(_points['index'], _points['Total'], color=color, s=100, label=action)
         ax.legend(loc = 'lower right')
         ax.set_ylabel('Strategy Total Value')
         
@@ -419,13 +1048,10 @@ class SimulateStrat:
         ax2.legend(loc = 'lower left')  
         ax2.set_ylabel('FTM Price')
 
-        if save_fig ==  False:
-            plt.show()    
-        else:
-            plt.savefig('sim_with_rebal.png')
+        self._save_or_show(fig, save_fig, filename)
 
-    def plot_total_vs_price(self, save_fig: bool = False):
-        df = self.simdf
+    def plot_total_vs_price(self, save_fig: bool = False, max_points: int = 5000, filename: str = 'sim_vs_price.png'):
+        df = self._plot_df(max_points, ['Total', 'Price'])
         
         # Plot 
         fig, ax = plt.subplots()
@@ -439,24 +1065,21 @@ class SimulateStrat:
         ax2.legend(loc = 'lower right')  
         ax2.set_ylabel('FTM Price')
         
-        if save_fig ==  False:
-            plt.show()    
-        else:
-            plt.savefig('sim_vs_price.png')
+        self._save_or_show(fig, save_fig, filename)
             
-    def plot_cr_exposure(self, save_fig: bool = False):
-        df = self.simdf
+    def plot_cr_exposure(self, save_fig: bool = False, max_points: int = 5000, filename: str = 'cr_and_exposure.png'):
+        df = self._plot_df(max_points, ['CR', 'Exposure'])
         
-        # Create rebalance points to plot
-        df['rebal_cr'] = np.where(df['Action'] == 'Collateral', df['CR'], np.nan)
-        df['rebal_exposure'] = np.where(df['Action'] == 'Exposure', df['Exposure'], np.nan)
+        # Rebalance points to plot
+        rebal_cr = df[df['Action'] == 'Collateral']
+        rebal_exposure = df[df['Action'] == 'Exposure']
         
         # Plot 
         fig, ax = plt.subplots()
         fig.set_size_inches(20,10)
 
         ax.plot('index', 'CR', data=df, color='blue', label='CR' )
-        ax.plot('index', 'rebal_cr', data=df, markersize=10, color='green', linestyle='', marker='o', label='Collateral Rebalance')
+        ax.plot(rebal_cr['index'], rebal_cr['CR'], markersize=10, color='green', linestyle='', marker='o', label='Collateral Rebalance')
         ax.axhline(y = self.max_cr, color = 'purple', linestyle = '--', label='Max CR')
         ax.axhline(y = self.min_cr, color = 'purple', linestyle = '--', label='Min CR')
         ax.legend(loc = 'lower right')   
@@ -464,19 +1087,16 @@ class SimulateStrat:
         
         ax2 = ax.twinx()
         ax2.plot('index', 'Exposure', data=df, color='orange', label='Exposure')      
-        ax2.plot('index', 'rebal_exposure', data=df, markersize=10, color='red', linestyle='', marker='o', label='Exposure Rebalance')
+        ax2.plot(rebal_exposure['index'], rebal_exposure['Exposure'], markersize=10, color='red', linestyle='', marker='o', label='Exposure Rebalance')
         ax2.axhline(y = self.te+self.e_thresh, color = 'y', linestyle = '--', label='Max Exposure')
         ax2.axhline(y = self.te-self.e_thresh, color = 'y', linestyle = '--', label='Min Exposure')
         ax2.legend(loc = 'lower left')  
         ax2.set_ylabel('Exposure')
         
-        if save_fig ==  False:
-            plt.show()    
-        else:
-            plt.savefig('cr_and_exposure.png')
+        self._save_or_show(fig, save_fig, filename)
  
-    def plot_te_with_price_levels(self, price_ranges, save_fig: bool = False):
-        df = self.simdf
+    def plot_te_with_price_levels(self, price_ranges, save_fig: bool = False, max_points: int = 5000, filename: str = 'cr_and_exposure.png'):
+        df = self._plot_df(max_points, ['Target Exposure', 'Price'])
 
         fig, ax = plt.subplots()
         fig.set_size_inches(20,10)
@@ -493,11 +1113,227 @@ class SimulateStrat:
         for k, v in price_ranges.items():
             ax2.axhline(y=k, color='purple', linestyle = '--')
         
-        if save_fig ==  False:
-            plt.show()    
-        else:
-            plt.savefig('cr_and_exposure.png')
+        self._save_or_show(fig, save_fig, filename)
+
+
+
+# Build parameter grid
+def param_grid(**params):
+    """
+    Function returns the cartesian product of the given parameter values as flat arrays.
+
+    Parameters
+    ----------
+    **params : list[float]
+        Values to combine for each parameter, e.g. tcr=[0.5, 0.6], min_cr=[0.4, 0.45].
+
+    Returns
+    -------
+    grid : dict[str, np.ndarray]
+        One array per parameter with one entry per combination.
+    """
     
+    _names = list(params.keys())
+    _mesh = np.meshgrid(*[np.atleast_1d(np.asarray(params[k], dtype=float)) for k in _names], indexing='ij')
+    return {k: m.ravel() for k, m in zip(_names, _mesh)}
+
+
+
+class SimulateStratBatch:
+    """
+    Runs many parameter sets through one price feed at once.
+
+    Strategy state is held as struct-of-arrays (one entry per parameter set) and the
+    rebalance checks are applied with masks, so each tick costs a handful of vectorized
+    operations regardless of the number of parameter sets. Only aggregates are kept per
+    parameter set, per tick totals are saved when record_totals is True.
+
+    pricefeed can also be 2D with shape (ticks, parameter sets) to run each set on its
+    own price path.
+    """
+    
+    def __init__(self, t: float, tcr, te, w1: float=0.5, w2: float=0.5, swapfee: float=0.0025):
+        # Set key params
+        tcr, te = np.broadcast_arrays(np.asarray(tcr, dtype=float), np.asarray(te, dtype=float))
+        self.tcr = np.atleast_1d(tcr).astype(float)
+        self.te = np.atleast_1d(te).astype(float)
+        self.w1 = w1
+        self.w2 = w2
+        self.swapfee = swapfee
+        self.n = len(self.tcr)
+        
+        # Get initial state
+        self.reset_strat(t)
+        
+    def reset_strat(self, t: float):
+        _c, _d, _l = want_state(t, self.tcr, self.te, self.w1)
+        self.c = np.broadcast_to(_c, (self.n,)).astype(float)
+        self.d = np.broadcast_to(_d, (self.n,)).astype(float)
+        self.l = np.broadcast_to(_l, (self.n,)).astype(float)
+        
+    def get_state(self):
+        return get_state(self.c, self.d, self.l, self.w1)
+    
+    def get_total(self):
+        return self.c-self.d+self.l
+    
+    def update_all(self, rc: float, rd: float, rl: float, p1_chg: float, p2_chg: float=0):
+        self.c, self.d, self.l = update_all(self.c, self.d, self.l, rc, rd, rl, p1_chg, p2_chg, self.w1, self.w2)
+    
+    def cr_rebal(self, mask):
+        _a, _c, _d, _l = cr_rebal(self.c, self.d, self.l, self.tcr)
+        self.c = np.where(mask, _c, self.c)
+        self.d = np.where(mask, _d, self.d)
+        self.l = np.where(mask, _l, self.l)
+    
+    def exposure_rebal(self, mask):
+        _e, _a, _c, _d, _l = exposure_rebal(self.c, self.d, self.l, self.te, self.w1, self.swapfee)
+        self.c = np.where(mask, _c, self.c)
+        self.d = np.where(mask, _d, self.d)
+        self.l = np.where(mask, _l, self.l)
+        
+    def update_exposure(self, te: float, mask):
+        c_fnl, d_fnl, l_fnl, _c, _d, _l = update_exposure_vec(self.c, self.d, self.l, te, self.tcr, self.swapfee)
+        self.c = np.where(mask, c_fnl, self.c)
+        self.d = np.where(mask, d_fnl, self.d)
+        self.l = np.where(mask, l_fnl, self.l)
+        self.te = np.where(mask, te, self.te)
+        
+    def run(self, pricefeed: list[float], c_apr: float, d_apr: float, l_apr: float, min_per_step: float, max_cr, e_thresh, min_cr, update_exposure: list[float]=[], record_totals: bool=False, 
+            pricechange: np.ndarray=None, metrics=None, metrics_chunk: int=4096):
+        """
+        Runs every parameter set over the price feed and returns one results row per set.
+
+        pricechange can be given instead of computing it from pricefeed, e.g. a slice of
+        price changes shared by several runs over windows of the same feed.
+        metrics is an optional risk_metrics.RiskMetrics updated every metrics_chunk ticks with
+        the totals, CR before rebalancing, LP values and rebalances of every set, its results
+        are added as columns.
+        """
+        
+        # Broadcast thresholds to one entry per parameter set
+        max_cr = np.broadcast_to(np.asarray(max_cr, dtype=float), (self.n,))
+        e_thresh = np.broadcast_to(np.asarray(e_thresh, dtype=float), (self.n,))
+        min_cr = np.broadcast_to(np.asarray(min_cr, dtype=float), (self.n,))
+        
+        # Get yield per step
+        steps_per_year = 365*24*60/min_per_step
+        c_yield = c_apr/steps_per_year
+        d_yield = d_apr/steps_per_year
+        l_yield = l_apr/steps_per_year
+        
+        # Get price percentage change
+        if pricechange is None:
+            pricechange = np.asarray(pricefeed, dtype=float)
+            pricechange = np.diff(pricechange, axis=0) / np.abs(pricechange[:-1])
+        
+        if len(update_exposure) == len(pricechange)+1:
+            update_exposure = update_exposure[1:]
+        
+        # Initial aggregates
+        _cr, _e = self.get_state()
+        _t = self.get_total()
+        t_initial = _t.copy()
+        t_min, t_max = _t.copy(), _t.copy()
+        max_drawdown = np.zeros(self.n)
+        cr_min, cr_max = _cr.copy(), _cr.copy()
+        e_min, e_max = _e.copy(), _e.copy()
+        n_collateral = np.zeros(self.n, dtype=np.int64)
+        n_exposure = np.zeros(self.n, dtype=np.int64)
+        n_both = np.zeros(self.n, dtype=np.int64)
+        n_updated = np.zeros(self.n, dtype=np.int64)
+        if record_totals == True:
+            t_feed = np.empty((len(pricechange)+1, self.n))
+            t_feed[0] = _t
+        if metrics is not None:
+            # Buffer of total, CR, LP and rebalance rows
+            _mbuf = np.empty((4, min(metrics_chunk, len(pricechange)+1), self.n))
+            _mbuf[:, 0] = _t, _cr, self.l, np.zeros(self.n)
+            _j = 1
+        
+        for i, p in enumerate(pricechange):
+            # Update state with given price change
+            self.update_all(c_yield, d_yield, l_yield, p)
+            _cr, _e = self.get_state()
+            _cr0 = _cr
+            np.minimum(cr_min, _cr, out=cr_min)
+            np.maximum(cr_max, _cr, out=cr_max)
+            np.minimum(e_min, _e, out=e_min)
+            np.maximum(e_max, _e, out=e_max)
+            
+            # Check if exposure needs to be updated
+            if len(update_exposure) > 0:
+                u = update_exposure[i]
+                u_rebal = self.te != u
+                if u_rebal.any():
+                    self.update_exposure(u, u_rebal)
+                    _cr, _e = self.get_state()
+            else:
+                u_rebal = np.zeros(self.n, dtype=bool)
+            
+            # Check if exposure needs to be rebalanced
+            e_rebal = np.abs(self.te - _e) > e_thresh
+            if e_rebal.any():
+                self.exposure_rebal(e_rebal)
+                _cr, _e = self.get_state()
+            
+            # Check if collateral needs to be rebalanced
+            cr_rebal = (_cr > max_cr) | (_cr < min_cr)
+            if cr_rebal.any():
+                self.cr_rebal(cr_rebal)
+            
+            # Count actions with the same precedence as SimulateStrat
+            _both = e_rebal & cr_rebal
+            n_both += _both
+            n_updated += u_rebal & ~_both
+            n_exposure += e_rebal & ~u_rebal & ~cr_rebal
+            n_collateral += cr_rebal & ~u_rebal & ~e_rebal
+            
+            _t = self.get_total()
+            np.minimum(t_min, _t, out=t_min)
+            np.maximum(t_max, _t, out=t_max)
+            np.maximum(max_drawdown, 1 - _t/t_max, out=max_drawdown)
+            if record_totals == True:
+                t_feed[i+1] = _t
+            if metrics is not None:
+                if _j == _mbuf.shape[1]:
+                    metrics.update(*_mbuf)
+                    _j = 0
+                _mbuf[:, _j] = _t, _cr0, self.l, u_rebal | e_rebal | cr_rebal
+                _j += 1
+        
+        # Save results
+        total_days = min_per_step*(len(pricechange)+1)/(60*24)
+        self.results = pd.DataFrame({
+            'Initial': t_initial,
+            'Final': _t,
+            'Max Total': t_max,
+            'Min Total': t_min,
+            'Max Drawdown': max_drawdown,
+            'Annualized Return': 365*((_t - t_initial)/total_days)/t_initial if total_days > 0 else np.nan,
+            'Max CR': cr_max,
+            'Min CR': cr_min,
+            'Max Exposure': e_max,
+            'Min Exposure': e_min,
+            'Collateral': n_collateral,
+            'Exposure': n_exposure,
+            'Both': n_both,
+            'Updated Exposure': n_updated
+        })
+        if record_totals == True:
+            self.t_feed = t_feed
+        if metrics is not None:
+            metrics.update(*_mbuf[:, :_j])
+            for k, v in metrics.results().items():
+                self.results[k] = v
+        
+        # Save sim params
+        self.min_per_step = min_per_step
+        self.max_cr = max_cr
+        self.e_thresh = e_thresh
+        self.min_cr = min_cr
+        
+        return self.results
 
 
 
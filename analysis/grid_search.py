@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+import os
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+
+import pandas as pd
+import numpy as np
+
+from .dynamic_hedging_sims import SimulateStrat, SimulateStratBatch, param_grid
+
+#=========================================#
+# GRID SEARCH
+
+# Functions
+#   Worker setup (attach shared price feed)
+#   Run chunk of parameter sets
+#   Grid search
+#   Successive halving
+
+# NOTE: price feed is copied once into shared memory, workers only receive parameter chunks
+# NOTE: successive halving simulates all candidates on a short prefix of the feed and only
+# the best 1/eta of them on each longer prefix, so most runs never see the full feed
+#=========================================#
+
+# Worker state, set by _init_worker
+_shm = None
+_prices = None
+
+
+# Worker setup
+def _init_worker(shm_name: str, n: int):
+    global _shm, _prices
+    _shm = SharedMemory(name=shm_name)
+    _prices = np.ndarray((n,), dtype=np.float64, buffer=_shm.buf)
+
+# Run chunk of parameter sets
+def _run_chunk(t: float, params: list[dict], run_kwargs: dict, strat_kwargs: dict):
+    summaries = []
+    for p in params:
+        strat = SimulateStrat(t, p['tcr'], p['te'], **strat_kwargs)
+        strat.run(_prices, max_cr=p['max_cr'], e_thresh=p['e_thresh'], min_cr=p['min_cr'], **run_kwargs)
+        summaries.append(strat.sim_stats())
+    return summaries
+
+# Grid search
+def grid_search(pricefeed: list[float], c_apr: float, d_apr: float, l_apr: float, min_per_step: float, tcr: list[float], min_cr: list[float],
+                max_cr: list[float], e_thresh: list[float], te: list[float]=[0.0], t: float=1000, w1: float=0.5, w2: float=0.5, swapfee: float=0.0025,
+                mode: str='fast', processes: int=None, chunksize: int=None):
+    """
+    Function runs SimulateStrat for every combination of the given parameters across a process pool.
+
+    Parameters
+    ----------
+    pricefeed : list[float]
+        Variable token prices, placed once in shared memory for all workers.
+    c_apr, d_apr, l_apr : float
+        Collateral, debt and LP APRs.
+    min_per_step : float
+        Minutes between prices.
+    tcr, min_cr, max_cr, e_thresh, te : list[float]
+        Values to combine into the grid.
+    t : float
+        Initial strategy total.
+    mode : str
+        Run mode passed to SimulateStrat.run.
+    processes : int
+        Number of worker processes (defaults to all cores).
+    chunksize : int
+        Parameter sets per task (defaults to an even split over 4 tasks per worker).
+
+    Returns
+    -------
+    results : pd.DataFrame
+        One row per parameter set with the parameters and SimulateStrat.sim_stats.
+    """
+
+    grid = param_grid(tcr=tcr, min_cr=min_cr, max_cr=max_cr, e_thresh=e_thresh, te=te)
+    params = pd.DataFrame(grid)
+    records = params.to_dict('records')
+
+    processes = processes or os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, int(np.ceil(len(records)/(4*processes))))
+    chunks = [records[i:i+chunksize] for i in range(0, len(records), chunksize)]
+
+    run_kwargs = {'c_apr': c_apr, 'd_apr': d_apr, 'l_apr': l_apr, 'min_per_step': min_per_step, 'mode': mode, 'record': 'events'}
+    strat_kwargs = {'w1': w1, 'w2': w2, 'swapfee': swapfee}
+
+    # Copy price feed into shared memory once
+    prices = np.asarray(pricefeed, dtype=np.float64)
+    shm = SharedMemory(create=True, size=max(prices.nbytes, 1))
+    try:
+        np.ndarray(prices.shape, dtype=np.float64, buffer=shm.buf)[:] = prices
+        with Pool(processes, initializer=_init_worker, initargs=(shm.name, len(prices))) as pool:
+            results = pool.starmap(_run_chunk, [(t, c, run_kwargs, strat_kwargs) for c in chunks])
+    finally:
+        shm.close()
+        shm.unlink()
+
+    summary = pd.DataFrame([s for r in results for s in r])
+    return pd.concat([params, summary], axis=1)
+
+# Successive halving
+def successive_halving(pricefeed: list[float], c_apr: float, d_apr: float, l_apr: float, min_per_step: float, tcr: list[float], min_cr: list[float],
+                       max_cr: list[float], e_thresh: list[float], te: list[float]=[0.0], t: float=1000, w1: float=0.5, w2: float=0.5, swapfee: float=0.0025,
+                       eta: int=3, n_rounds: int=4, objective='Annualized Return', max_drawdown: float=None):
+    """
+    Function searches the parameter grid by successive halving on growing prefixes of the price feed.
+
+    Every round runs the remaining candidates with SimulateStratBatch on the first horizon prices,
+    keeps the best 1/eta of them by objective and multiplies the horizon by eta, the last round
+    runs on the whole feed. Candidates are rerun from the start of the feed each round, so
+    results match a full run on that prefix.
+
+    Parameters
+    ----------
+    pricefeed, c_apr, d_apr, l_apr, min_per_step, tcr, min_cr, max_cr, e_thresh, te, t : 
+        Same as grid_search, combinations without min_cr < tcr < max_cr are skipped.
+    eta : int
+        Horizon growth and reduction factor per round.
+    n_rounds : int
+        Number of rounds, the first one runs on len(pricefeed)/eta**(n_rounds-1) prices.
+    objective : str or callable
+        SimulateStratBatch.results column to maximize, or a function of the results returning
+        one score per candidate (higher is better).
+    max_drawdown : float
+        Candidates with a larger Max Drawdown are stopped early, whatever their score.
+
+    Returns
+    -------
+    results : pd.DataFrame
+        Candidates of the last round with their parameters and SimulateStratBatch results, best first.
+    rounds : pd.DataFrame
+        One row per round with the horizon, the number of candidates run and kept and the simulated ticks.
+    """
+
+    prices = np.asarray(pricefeed, dtype=float)
+    n = len(prices)
+    if eta < 2:
+        raise ValueError('eta must be at least 2')
+    
+    grid = param_grid(tcr=tcr, min_cr=min_cr, max_cr=max_cr, e_thresh=e_thresh, te=te)
+    _valid = (grid['min_cr'] < grid['tcr']) & (grid['tcr'] < grid['max_cr'])
+    if not _valid.any():
+        raise ValueError('no parameter set with min_cr < tcr < max_cr')
+    params = pd.DataFrame(grid)[_valid].reset_index(drop=True)
+    
+    # Horizons grow by eta up to the whole feed
+    horizons = [max(n//eta**k, 2) for k in range(n_rounds-1, -1, -1)]
+    horizons[-1] = n
+    
+    rounds = []
+    for horizon in horizons:
+        strat = SimulateStratBatch(t, params['tcr'].values, params['te'].values, w1, w2, swapfee)
+        results = strat.run(prices[:horizon], c_apr, d_apr, l_apr, min_per_step, params['max_cr'].values, params['e_thresh'].values, params['min_cr'].values)
+        score = np.asarray(objective(results) if callable(objective) else results[objective], dtype=float)
+        
+        # Early stop candidates over the drawdown limit, it can only grow with the horizon
+        _alive = np.isfinite(score)
+        if max_drawdown is not None:
+            _alive &= results['Max Drawdown'].values <= max_drawdown
+        
+        _last = len(rounds) == n_rounds-1
+        _keep = len(params) if _last else max(1, int(np.ceil(len(params)/eta)))
+        _order = np.flatnonzero(_alive)[np.argsort(-score[_alive], kind='stable')][:_keep]
+        rounds.append({'Round': len(rounds), 'Horizon': horizon, 'Candidates': len(params), 'Stopped': int((~_alive).sum()), 
+                       'Kept': len(_order), 'Ticks': len(params)*horizon})
+        
+        params = params.iloc[_order].reset_index(drop=True)
+        results = results.iloc[_order].reset_index(drop=True)
+        if len(params) == 0:
+            break
+    
+    return pd.concat([params, results], axis=1), pd.DataFrame(rounds)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+from .vault_accounting import SECONDARY_FEE, STRATEGIST_FEE
+
+#=========================================#
+# HARVEST SCHEDULING
+
+# Functions
+#   Harvest growth factors
+#   Harvest interval search
+
+# NOTE: farming rewards accrue on the LP value every tick but are only compounded when harvest
+# runs, each harvest pays the harvest fees on the rewards and a fixed gas cost
+# NOTE: vault assets are affine in the TVL (V*X - gas*Y) with X and Y independent of the TVL,
+# so every TVL level is scored from one pass over the harvests of each interval
+#=========================================#
+
+
+# Harvest growth factors
+def harvest_factors(strat, reward_apr: float, interval: int, secondary_fee: float=SECONDARY_FEE, strategist_fee: float=STRATEGIST_FEE):
+    """
+    Function returns the growth factors of vault assets when harvesting every interval ticks.
+
+    Parameters
+    ----------
+    strat : SimulateStrat
+        Strategy after run with record='full', its l_apr includes reward_apr.
+    reward_apr : float
+        Part of the l_apr paid as farming rewards.
+    interval : int
+        Ticks between harvests, the last tick is always harvested.
+    secondary_fee, strategist_fee : float
+        Harvest fees of the strategy contract.
+
+    Returns
+    -------
+    x : float
+        Final assets per unit of initial assets without gas.
+    y : float
+        Final assets lost per unit of gas cost.
+    n_harvests : int
+        Number of harvests.
+    """
+
+    if getattr(strat, 'index_feed', None) is not None:
+        raise ValueError("harvest model needs every tick, run the strategy with record='full'")
+
+    t = np.asarray(strat.t_feed, dtype=float)
+    l = np.asarray(strat.l_feed, dtype=float)
+    _fee_share = secondary_fee + (1 - secondary_fee)*strategist_fee
+
+    # Rewards per tick per unit of assets and growth without them
+    q = l[:-1]/t[:-1]*reward_apr*strat.min_per_step/(365*24*60)
+    growth = np.concatenate(([1.0], np.cumprod(t[1:]/t[:-1] - q)))
+
+    # Rewards accrued up to every tick per unit of assets at tick 0
+    accrued = np.concatenate(([0.0], np.cumsum(growth[:-1]*q)))
+
+    # Assets multiplier over every harvest period
+    _h = np.unique(np.append(np.arange(interval, len(t), interval), len(t)-1))
+    _prev = np.concatenate(([0], _h[:-1]))
+    m = (growth[_h] + (1 - _fee_share)*(accrued[_h] - accrued[_prev]))/growth[_prev]
+    _x = np.cumprod(m)
+    return _x[-1], (_x[-1]/_x).sum(), len(_h)
+
+# Harvest interval search
+def harvest_search(strat, reward_apr: float, intervals: list[int], tvls: list[float], gas_cost: float,
+                   secondary_fee: float=SECONDARY_FEE, strategist_fee: float=STRATEGIST_FEE):
+    """
+    Function returns the net return of every harvest interval at every TVL and the best interval per TVL.
+
+    Parameters
+    ----------
+    strat, reward_apr, secondary_fee, strategist_fee :
+        Same as harvest_factors.
+    intervals : list[int]
+        Ticks between harvests to compare.
+    tvls : list[float]
+        Initial vault assets to compare.
+    gas_cost : float
+        Gas cost of one harvest in vault assets.
+
+    Returns
+    -------
+    best : pd.DataFrame
+        One row per TVL with the best interval in ticks and hours, its number of harvests and net return.
+    grid : pd.DataFrame
+        Net return with one row per interval and one column per TVL.
+    """
+
+    intervals = np.atleast_1d(np.asarray(intervals, dtype=np.int64))
+    tvls = np.atleast_1d(np.asarray(tvls, dtype=float))
+    if (intervals < 1).any():
+        raise ValueError('intervals must be at least 1 tick')
+
+    factors = np.array([harvest_factors(strat, reward_apr, h, secondary_fee, strategist_fee) for h in intervals])
+    x, y, n_harvests = factors[:, 0], factors[:, 1], factors[:, 2].astype(np.int64)
+    net_return = x[:, None] - gas_cost*y[:, None]/tvls[None, :] - 1
+
+    _best = np.argmax(net_return, axis=0)
+    best = pd.DataFrame({
+        'TVL': tvls,
+        'Interval': intervals[_best],
+        'Interval Hours': intervals[_best]*strat.min_per_step/60,
+        'Harvests': n_harvests[_best],
+        'Net Return': net_return[_best, np.arange(len(tvls))]
+    })
+    grid = pd.DataFrame(net_return, index=pd.Index(intervals, name='Interval'), columns=pd.Index(tvls, name='TVL'))
+    return best, grid
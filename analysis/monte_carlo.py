@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+from multiprocessing import Pool
+
+import pandas as pd
+import numpy as np
+
+from .dynamic_hedging_sims import SimulateStratBatch
+
+#=========================================#
+# MONTE CARLO SIMULATIONS
+
+# Functions
+#   GBM price paths
+#   Jump-diffusion price paths
+#   Block bootstrap price paths
+#   Simulate price paths
+#   Run chunk of paths
+#   Monte carlo
+
+# NOTE: paths are generated and simulated chunk by chunk, only per path results are kept
+# NOTE: each chunk gets its own RNG stream spawned from the seed, results don't depend on the number of workers
+#=========================================#
+
+MINUTES_PER_YEAR = 365*24*60
+
+
+# GBM price paths
+def gbm_paths(rng: np.random.Generator, n_paths: int, n_steps: int, s0: float, min_per_step: float, mu: float=0.0, sigma: float=1.0):
+    """
+    Function returns geometric brownian motion price paths.
+
+    Parameters
+    ----------
+    rng : np.random.Generator
+        Random number generator.
+    n_paths : int
+        Number of paths.
+    n_steps : int
+        Number of price changes per path.
+    s0 : float
+        Initial price.
+    min_per_step : float
+        Minutes between prices.
+    mu : float
+        Annualized drift.
+    sigma : float
+        Annualized volatility.
+
+    Returns
+    -------
+    prices : np.ndarray
+        Prices with shape (n_steps+1, n_paths).
+    """
+
+    _dt = min_per_step/MINUTES_PER_YEAR
+    _r = (mu - 0.5*sigma**2)*_dt + sigma*np.sqrt(_dt)*rng.standard_normal((n_steps, n_paths))
+    return _log_returns_to_prices(_r, s0)
+
+# Jump-diffusion price paths
+def jump_diffusion_paths(rng: np.random.Generator, n_paths: int, n_steps: int, s0: float, min_per_step: float, mu: float=0.0, sigma: float=1.0,
+                         jump_rate: float=10.0, jump_mean: float=-0.05, jump_std: float=0.1):
+    """
+    Function returns Merton jump-diffusion price paths.
+
+    Parameters
+    ----------
+    jump_rate : float
+        Expected number of jumps per year.
+    jump_mean : float
+        Mean of the log jump size.
+    jump_std : float
+        Standard deviation of the log jump size.
+
+    Other parameters are the same as gbm_paths. Drift is compensated so mu stays the expected return.
+    """
+
+    _dt = min_per_step/MINUTES_PER_YEAR
+    _k = np.exp(jump_mean + 0.5*jump_std**2) - 1
+    _r = (mu - jump_rate*_k - 0.5*sigma**2)*_dt + sigma*np.sqrt(_dt)*rng.standard_normal((n_steps, n_paths))
+    _n_jumps = rng.poisson(jump_rate*_dt, (n_steps, n_paths))
+    _jumps = np.flatnonzero(_n_jumps)
+    if len(_jumps) > 0:
+        _n = _n_jumps.flat[_jumps]
+        _r.flat[_jumps] += _n*jump_mean + np.sqrt(_n)*jump_std*rng.standard_normal(len(_jumps))
+    return _log_returns_to_prices(_r, s0)
+
+# Block bootstrap price paths
+def block_bootstrap_paths(rng: np.random.Generator, n_paths: int, n_steps: int, s0: float, historical: list[float], block_size: int=24):
+    """
+    Function returns price paths built from random blocks of historical log returns.
+
+    Parameters
+    ----------
+    historical : list[float]
+        Historical price feed, sampled at the same frequency as the paths.
+    block_size : int
+        Number of consecutive returns per block.
+
+    Other parameters are the same as gbm_paths.
+    """
+
+    _hist = np.diff(np.log(np.asarray(historical, dtype=float)))
+    block_size = min(block_size, len(_hist))
+    _n_blocks = int(np.ceil(n_steps/block_size))
+    _starts = rng.integers(0, len(_hist) - block_size + 1, (_n_blocks, n_paths))
+    _idx = (_starts[:, None, :] + np.arange(block_size)[None, :, None]).reshape(-1, n_paths)[:n_steps]
+    return _log_returns_to_prices(_hist[_idx], s0)
+
+def _log_returns_to_prices(r: np.ndarray, s0: float):
+    prices = np.empty((r.shape[0]+1, r.shape[1]))
+    prices[0] = s0
+    np.cumsum(r, axis=0, out=prices[1:])
+    np.exp(prices[1:], out=prices[1:])
+    prices[1:] *= s0
+    return prices
+
+# Simulate price paths
+path_models = {
+    'gbm': gbm_paths,
+    'jump': jump_diffusion_paths,
+    'bootstrap': block_bootstrap_paths
+}
+
+def simulate_paths(model: str, rng: np.random.Generator, n_paths: int, n_steps: int, s0: float, min_per_step: float, **model_params):
+    if model not in path_models:
+        raise ValueError('model must be one of {}'.format(list(path_models.keys())))
+    if model == 'bootstrap':
+        return block_bootstrap_paths(rng, n_paths, n_steps, s0, **model_params)
+    return path_models[model](rng, n_paths, n_steps, s0, min_per_step, **model_params)
+
+# Run chunk of paths
+def _run_chunk(seed: np.random.SeedSequence, n_paths: int, tcr: float, path_kwargs: dict, strat_kwargs: dict, run_kwargs: dict):
+    rng = np.random.default_rng(seed)
+    prices = simulate_paths(rng=rng, n_paths=n_paths, **path_kwargs)
+    strat = SimulateStratBatch(tcr=np.full(n_paths, tcr), **strat_kwargs)
+    return strat.run(prices, **run_kwargs)
+
+# Monte carlo
+def monte_carlo(model: str, n_paths: int, n_steps: int, t: float, tcr: float, te: float, c_apr: float, d_apr: float, l_apr: float, min_per_step: float,
+                max_cr: float, e_thresh: float, min_cr: float, s0: float=1.0, w1: float=0.5, w2: float=0.5, swapfee: float=0.0025,
+                chunk_size: int=1000, seed: int=None, processes: int=1, **model_params):
+    """
+    Function runs the strategy over simulated price paths and returns the distribution of results.
+
+    Parameters
+    ----------
+    model : str
+        Price model: 'gbm', 'jump' (jump-diffusion) or 'bootstrap' (block bootstrap, needs historical).
+    n_paths : int
+        Number of paths.
+    n_steps : int
+        Number of price changes per path.
+    t, tcr, te : float
+        Strategy initial total, target collateral ratio and target exposure.
+    c_apr, d_apr, l_apr, min_per_step, max_cr, e_thresh, min_cr : float
+        Same as SimulateStrat.run.
+    s0 : float
+        Initial price of every path.
+    chunk_size : int
+        Paths generated and simulated together, bounds memory to chunk_size*n_steps prices.
+    seed : int
+        Seed for the spawned per chunk RNG streams.
+    processes : int
+        Number of worker processes for chunks.
+    **model_params
+        Parameters of the price model (mu, sigma, jump_rate, historical, block_size...).
+
+    Returns
+    -------
+    results : pd.DataFrame
+        One row per path with final value, max drawdown and rebalance counts.
+    """
+
+    _n_chunks = int(np.ceil(n_paths/chunk_size))
+    seeds = np.random.SeedSequence(seed).spawn(_n_chunks)
+    sizes = [min(chunk_size, n_paths - i*chunk_size) for i in range(_n_chunks)]
+
+    path_kwargs = dict(model=model, n_steps=n_steps, s0=s0, min_per_step=min_per_step, **model_params)
+    strat_kwargs = {'t': t, 'te': te, 'w1': w1, 'w2': w2, 'swapfee': swapfee}
+    run_kwargs = {'c_apr': c_apr, 'd_apr': d_apr, 'l_apr': l_apr, 'min_per_step': min_per_step, 'max_cr': max_cr, 'e_thresh': e_thresh, 'min_cr': min_cr}
+    tasks = [(s, n, tcr, path_kwargs, strat_kwargs, run_kwargs) for s, n in zip(seeds, sizes)]
+
+    if processes == 1:
+        results = [_run_chunk(*task) for task in tasks]
+    else:
+        with Pool(processes) as pool:
+            results = pool.starmap(_run_chunk, tasks)
+
+    results = pd.concat(results, ignore_index=True)
+    results['Rebalances'] = results[['Collateral', 'Exposure', 'Both']].sum(axis=1)
+    return results
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import os
+from multiprocessing import Pool
+
+import matplotlib.pyplot as plt
+
+from .dynamic_hedging_sims import SimulateStrat
+
+#=========================================#
+# PLOTTING
+
+# Functions
+#   Worker setup (headless backend)
+#   Render figures of one strategy
+#   Render batch of strategies
+
+# NOTE: strategies are downsampled in the parent process, workers only receive the reduced simdf
+#=========================================#
+
+
+# Worker setup
+def _init_worker():
+    plt.switch_backend('Agg')
+
+# Render figures of one strategy
+def render(strat: SimulateStrat, plots: list, out_dir: str, prefix: str):
+    """
+    Function saves the given plots of a strategy as png files.
+
+    Parameters
+    ----------
+    strat : SimulateStrat
+        Strategy after calling run (or its downsampled copy).
+    plots : list
+        Plot method names, or (name, kwargs) tuples for methods that need arguments
+        such as ('plot_te_with_price_levels', {'price_ranges': ...}).
+    out_dir : str
+        Directory for the png files.
+    prefix : str
+        File name prefix, files are named <prefix>_<plot>.png.
+
+    Returns
+    -------
+    files : list[str]
+        Saved file paths.
+    """
+
+    files = []
+    for plot in plots:
+        name, kwargs = plot if isinstance(plot, tuple) else (plot, {})
+        _file = os.path.join(out_dir, '{}_{}.png'.format(prefix, name.replace('plot_', '')))
+        getattr(strat, name)(save_fig=True, max_points=None, filename=_file, **kwargs)
+        files.append(_file)
+    return files
+
+# Render batch of strategies
+def render_batch(strats: list[SimulateStrat], plots: list, out_dir: str, names: list[str]=None, max_points: int=5000, processes: int=None):
+    """
+    Function renders the same plots for many strategies in parallel worker processes with the Agg backend.
+
+    Each simdf is downsampled with LTTB to about max_points per plotted column before it is
+    sent to the workers, all rebalance points are kept.
+
+    Parameters
+    ----------
+    strats : list[SimulateStrat]
+        Strategies after calling run.
+    plots : list
+        Same as render.
+    out_dir : str
+        Directory for the png files.
+    names : list[str]
+        File name prefix per strategy (defaults to sim_<i>).
+    max_points : int
+        Points per plotted column after downsampling.
+    processes : int
+        Number of worker processes (defaults to all cores).
+
+    Returns
+    -------
+    files : list[list[str]]
+        Saved file paths per strategy.
+    """
+
+    os.makedirs(out_dir, exist_ok=True)
+    names = names or ['sim_{}'.format(i) for i in range(len(strats))]
+    tasks = [(s.downsampled(max_points), plots, out_dir, n) for s, n in zip(strats, names)]
+    with Pool(processes, initializer=_init_worker) as pool:
+        return pool.starmap(render, tasks)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+#=========================================#
+# RISK METRICS
+
+# Functions
+#   Risk metrics (incremental, one or many runs)
+#   Metrics of a SimulateStrat run
+#   Metrics of a SimulateStrat stream
+
+# NOTE: every metric is updated in one pass over each chunk of ticks and only running state
+# is kept between chunks, so feeds of any length are scored in O(n) time and O(chunk) memory
+# NOTE: arrays with shape (ticks, runs) are scored for every run at once (e.g. SimulateStratBatch)
+#=========================================#
+
+MINUTES_PER_YEAR = 365*24*60
+
+
+# Risk metrics
+class RiskMetrics:
+    """
+    Incremental risk metrics of one or many strategy runs.
+
+    Call update with consecutive chunks of per tick values, then results. Values are 1D for one
+    run or 2D with shape (ticks, runs).
+
+    Parameters
+    ----------
+    min_per_step : float
+        Minutes between ticks, Sharpe and Sortino are computed from per tick returns and annualized.
+    min_cr, max_cr : float
+        CR band, can hold one value per run. Time outside the band is only computed when both are given.
+    """
+
+    def __init__(self, min_per_step: float, min_cr=None, max_cr=None):
+        self.min_per_step = min_per_step
+        self.min_cr = min_cr
+        self.max_cr = max_cr
+        self.n_ticks = 0
+
+    def _init_state(self, total: np.ndarray, lp: np.ndarray):
+        _m = total.shape[1]
+        self.initial = total[0].copy()
+        self.peak = total[0].copy()
+        self.prev_total = total[0].copy()
+        self.prev_lp = lp[0].copy() if lp is not None else np.zeros(_m)
+        self.max_drawdown = np.zeros(_m)
+        self.underwater = np.zeros(_m, dtype=np.int64)
+        self.max_underwater = np.zeros(_m, dtype=np.int64)
+        self.n_returns = 0
+        self.sum_r = np.zeros(_m)
+        self.sum_r2 = np.zeros(_m)
+        self.sum_down2 = np.zeros(_m)
+        self.cr_ticks = 0
+        self.outside_cr = np.zeros(_m, dtype=np.int64)
+        self.turnover = np.zeros(_m)
+
+    def update(self, total, cr=None, lp=None, action=None):
+        """
+        Updates the metrics with the next chunk of ticks.
+
+        Parameters
+        ----------
+        total : np.ndarray
+            Strategy totals.
+        cr : np.ndarray
+            CR before rebalancing, for the time outside the CR band.
+        lp : np.ndarray
+            LP values, with action for the turnover.
+        action : np.ndarray
+            Action codes (or booleans), ticks different from 0 are rebalances.
+        """
+
+        total = np.asarray(total, dtype=float)
+        self._squeeze = total.ndim < 2
+        _shape = (total.size if total.ndim < 2 else total.shape[0], -1)
+        total = total.reshape(_shape)
+        cr = None if cr is None else np.asarray(cr, dtype=float).reshape(_shape)
+        lp = None if lp is None else np.asarray(lp, dtype=float).reshape(_shape)
+        action = None if action is None else np.asarray(action).reshape(_shape)
+        k = total.shape[0]
+        if k == 0:
+            return
+
+        _first = self.n_ticks == 0
+        if _first:
+            self._init_state(total, lp)
+
+        # Drawdown from the running peak
+        peak = np.maximum.accumulate(np.vstack([self.peak, total]), axis=0)[1:]
+        np.maximum(self.max_drawdown, (1 - total/peak).max(axis=0), out=self.max_drawdown)
+
+        # Longest run below the peak, counting ticks underwater at the end of the last chunk
+        _pos = np.arange(k)[:, None]
+        _reset = np.where(total < peak, -1 - self.underwater, _pos)
+        np.maximum.accumulate(_reset, axis=0, out=_reset)
+        _run = _pos - _reset
+        np.maximum(self.max_underwater, _run.max(axis=0), out=self.max_underwater)
+        self.underwater = _run[-1]
+        self.peak = peak[-1]
+
+        # Per tick returns
+        _r = total/np.vstack([self.prev_total, total[:-1]]) - 1
+        if _first:
+            _r = _r[1:]
+        self.n_returns += len(_r)
+        self.sum_r += _r.sum(axis=0)
+        self.sum_r2 += (_r*_r).sum(axis=0)
+        _down = np.minimum(_r, 0)
+        self.sum_down2 += (_down*_down).sum(axis=0)
+        self.prev_total = total[-1].copy()
+
+        # Ticks outside the CR band
+        if cr is not None and self.min_cr is not None and self.max_cr is not None:
+            self.cr_ticks += k
+            self.outside_cr += ((cr < self.min_cr) | (cr > self.max_cr)).sum(axis=0)
+
+        # LP value moved at rebalance ticks, includes the price move of that tick
+        if lp is not None and action is not None:
+            _moved = np.abs(lp - np.vstack([self.prev_lp, lp[:-1]]))
+            self.turnover += np.where(action != 0, _moved, 0).sum(axis=0)
+            self.prev_lp = lp[-1].copy()
+
+        self.n_ticks += k
+
+    def results(self):
+        """
+        Returns a dict with Max Drawdown, Max Drawdown Days (longest time below a previous peak),
+        annualized Sharpe and Sortino, Time Outside CR Band (fraction of ticks) and Turnover (LP value
+        moved by rebalances over the initial total). Values are arrays with one entry per run, or
+        floats when the ticks were 1D.
+        """
+
+        if self.n_ticks == 0:
+            raise ValueError('no ticks to compute metrics from')
+
+        _annualize = np.sqrt(MINUTES_PER_YEAR/self.min_per_step)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            _n = max(self.n_returns, 1)
+            _mean = self.sum_r/_n
+            _std = np.sqrt(np.maximum(self.sum_r2/_n - _mean**2, 0))
+            _downside = np.sqrt(self.sum_down2/_n)
+            metrics = {
+                'Max Drawdown': self.max_drawdown,
+                'Max Drawdown Days': self.max_underwater*self.min_per_step/(60*24),
+                'Sharpe': np.where(_std > 0, _mean/_std*_annualize, np.nan),
+                'Sortino': np.where(_downside > 0, _mean/_downside*_annualize, np.nan),
+                'Time Outside CR Band': self.outside_cr/self.cr_ticks if self.cr_ticks > 0 else np.full(len(_mean), np.nan),
+                'Turnover': self.turnover/self.initial
+            }
+        if self._squeeze == True:
+            return {k: float(v[0]) for k, v in metrics.items()}
+        return metrics
+
+# Metrics of a SimulateStrat run
+def strat_metrics(strat, min_cr: float=None, max_cr: float=None, chunk_size: int=1000000):
+    """
+    Function returns the RiskMetrics results of a SimulateStrat run recorded with record='full'.
+
+    Feeds are read chunk_size ticks at a time, so memory-mapped feeds are never loaded whole.
+    The CR band defaults to the min_cr and max_cr of the run.
+    """
+
+    if getattr(strat, 'index_feed', None) is not None:
+        raise ValueError("metrics need every tick, run the strategy with record='full'")
+    metrics = RiskMetrics(strat.min_per_step, strat.min_cr if min_cr is None else min_cr, strat.max_cr if max_cr is None else max_cr)
+    for s in range(0, len(strat.t_feed), chunk_size):
+        e = s + chunk_size
+        metrics.update(strat.t_feed[s:e], strat.cr_feed[s:e], strat.l_feed[s:e], strat.action_feed[s:e])
+    return metrics.results()
+
+# Metrics of a SimulateStrat stream
+def stream_metrics(states, metrics: RiskMetrics, chunk_size: int=1024):
+    """
+    Generator passing through the states yielded by SimulateStrat.stream while feeding them to metrics.
+
+    States are buffered and metrics are updated chunk_size ticks at a time, metrics.results() is
+    up to date once the generator is exhausted.
+    """
+
+    _buf = []
+    for state in states:
+        _buf.append((state['Total'], state['CR'], state['LP'], state['Action'] != 'No Action'))
+        if len(_buf) == chunk_size:
+            metrics.update(*np.array(_buf).T)
+            _buf = []
+        yield state
+    if len(_buf) > 0:
+        metrics.update(*np.array(_buf).T)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import hashlib
+import inspect
+
+import numpy as np
+
+from .dynamic_hedging_sims import SimulateStrat, FEEDS
+
+#=========================================#
+# SIMULATION CACHE
+
+# Functions
+#   Cache key
+#   Simulation cache (get, put, evict, clear)
+#   Cached run
+
+# NOTE: results are keyed by a hash of the price feed, the exposure schedule, the initial
+# strategy state and every run param, so any change of inputs is a cache miss
+# NOTE: least recently used entries (by file mtime) are evicted when the cache exceeds max_bytes
+#=========================================#
+
+# Version of the cached results, bump when the simulation results change
+CACHE_VERSION = 1
+
+# Strategy attributes saved with the feeds
+STATE = ['c', 'd', 'l', 'te', 'min_per_step', 'max_cr', 'e_thresh', 'min_cr']
+
+
+# Cache key
+def cache_key(strat: SimulateStrat, pricefeed: list[float], update_exposure: list[float], run_kwargs: dict):
+    """
+    Function returns the content hash identifying a run.
+
+    Parameters
+    ----------
+    strat : SimulateStrat
+        Strategy before calling run.
+    pricefeed : list[float]
+        Price feed passed to run.
+    update_exposure : list[float]
+        Exposure schedule passed to run.
+    run_kwargs : dict
+        Every other run param.
+
+    Returns
+    -------
+    key : str
+        Hex digest.
+    """
+
+    h = hashlib.blake2b(digest_size=20)
+    h.update(np.ascontiguousarray(pricefeed, dtype=np.float64))
+    h.update(b'|')
+    h.update(np.ascontiguousarray(update_exposure, dtype=np.float64))
+    params = {
+        'version': CACHE_VERSION,
+        'c': strat.c, 'd': strat.d, 'l': strat.l,
+        'tcr': strat.tcr, 'te': strat.te, 'w1': strat.w1, 'w2': strat.w2, 'swapfee': strat.swapfee,
+        'run': run_kwargs
+    }
+    h.update(json.dumps(params, sort_keys=True, default=float).encode())
+    return h.hexdigest()
+
+# Simulation cache
+class SimCache:
+    """
+    On-disk cache of SimulateStrat.run results.
+
+    Each entry is one .npz file with a column per feed plus the aggregates and final
+    strategy state, named by its cache_key.
+    """
+
+    def __init__(self, path: str, max_bytes: int=2**30):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key: str):
+        return os.path.join(self.path, key+'.npz')
+
+    def get(self, key: str, strat: SimulateStrat, pricefeed: list[float]):
+        """
+        Loads the cached results into strat, returns False on a cache miss.
+        """
+        _file = self._file(key)
+        if not os.path.exists(_file):
+            return False
+        with np.load(_file) as f:
+            for k in FEEDS:
+                setattr(strat, k, f[k])
+            strat.index_feed = f['index_feed'] if 'index_feed' in f else None
+            strat.action_counts = f['action_counts']
+            meta = json.loads(str(f['meta']))
+        strat.aggregates = meta['aggregates']
+        for k in STATE:
+            setattr(strat, k, meta['state'][k])
+        strat.pricefeed = pricefeed
+        strat._simdf = None
+
+        # Mark as recently used
+        os.utime(_file)
+        return True
+
+    def put(self, key: str, strat: SimulateStrat):
+        meta = {
+            'aggregates': {k: float(v) for k, v in strat.aggregates.items()},
+            'state': {k: float(getattr(strat, k)) for k in STATE}
+        }
+        arrays = {k: np.asarray(getattr(strat, k)) for k in FEEDS}
+        if strat.index_feed is not None:
+            arrays['index_feed'] = strat.index_feed
+        _tmp = self._file(key+'.tmp')
+        np.savez(_tmp, action_counts=strat.action_counts, meta=json.dumps(meta), **arrays)
+        os.replace(_tmp, self._file(key))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith('.npz') and not name.endswith('.tmp.npz'):
+                _stat = os.stat(os.path.join(self.path, name))
+                entries.append((_stat.st_mtime, _stat.st_size, name))
+        total = sum(e[1] for e in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.path, name))
+            total -= size
+
+    def invalidate(self, key: str):
+        if os.path.exists(self._file(key)):
+            os.remove(self._file(key))
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            if name.endswith('.npz'):
+                os.remove(os.path.join(self.path, name))
+
+# Cached run
+def cached_run(strat: SimulateStrat, cache: SimCache, pricefeed: list[float], update_exposure: list[float]=[], **run_kwargs):
+    """
+    Function calls strat.run, or loads its results from cache when the same run was done before.
+
+    Parameters are the same as SimulateStrat.run, given as keywords. Runs with a checkpoint_dir are not cached.
+
+    Returns
+    -------
+    hit : bool
+        True if the results came from the cache.
+    """
+
+    if run_kwargs.get('checkpoint_dir') is not None:
+        strat.run(pricefeed, update_exposure=update_exposure, **run_kwargs)
+        return False
+
+    # Fill in defaults so omitted and explicit default params share a key
+    _args = inspect.signature(SimulateStrat.run).bind(strat, pricefeed, update_exposure=update_exposure, **run_kwargs)
+    _args.apply_defaults()
+    _params = {k: v for k, v in _args.arguments.items() if k not in ('self', 'pricefeed', 'update_exposure')}
+    
+    key = cache_key(strat, pricefeed, update_exposure, _params)
+    if cache.get(key, strat, pricefeed) == True:
+        return True
+    strat.run(pricefeed, update_exposure=update_exposure, **run_kwargs)
+    cache.put(key, strat)
+    return False
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+from .dynamic_hedging_sims import want_state, get_state, cr_rebal, exposure_rebal
+
+#=========================================#
+# STRESS TESTS
+
+# Functions
+#   Shock scenarios (instant move, gap, slow bleed, spike and revert)
+#   Scenario library
+#   Stress test
+
+# NOTE: every scenario is applied to every strategy state at once, state arrays have shape
+# (scenarios, sets) and the loop only runs over the ticks of the longest scenario
+# NOTE: CR is debt/collateral, the debt is the variable token so price increases push CR
+# towards the liquidation threshold
+# NOTE: yields are ignored, scenarios are short compared to the APRs
+#=========================================#
+
+
+# Shock scenarios
+def instant_move(move: float):
+    """
+    Price moves by move (e.g. -0.5 for -50%) in one tick.
+    """
+    return np.array([move])
+
+def gap_move(move: float, follow: float, ticks: int):
+    """
+    Price gaps by move in one tick, then moves by follow more spread over ticks.
+    """
+    return np.concatenate(([move], slow_bleed(follow, ticks)))
+
+def slow_bleed(move: float, ticks: int):
+    """
+    Price moves by move in equal log steps over ticks.
+    """
+    return np.full(ticks, (1+move)**(1/ticks) - 1)
+
+def spike_and_revert(move: float, ticks: int):
+    """
+    Price moves by move in one tick and goes back to the initial price over ticks.
+    """
+    return np.concatenate(([move], slow_bleed(1/(1+move) - 1, ticks)))
+
+# Scenario library, name: price changes per tick
+scenarios = {
+    'instant -50%': instant_move(-0.5),
+    'instant -30%': instant_move(-0.3),
+    'instant +30%': instant_move(0.3),
+    'instant +50%': instant_move(0.5),
+    'instant +100%': instant_move(1.0),
+    'gap +20% then +30% over 24 ticks': gap_move(0.2, 0.3, 24),
+    'gap +40% then +40% over 24 ticks': gap_move(0.4, 0.4, 24),
+    'gap -30% then -30% over 24 ticks': gap_move(-0.3, -0.3, 24),
+    'bleed -50% over 168 ticks': slow_bleed(-0.5, 168),
+    'bleed +100% over 168 ticks': slow_bleed(1.0, 168),
+    'spike +50% and revert over 24 ticks': spike_and_revert(0.5, 24),
+    'spike -50% and revert over 24 ticks': spike_and_revert(-0.5, 24)
+}
+
+# Stress test
+def stress_test(tcr, min_cr, max_cr, e_thresh, te=0.0, c=None, d=None, l=None, t: float=1000, liq_cr=0.85, latency: int=0,
+                close_factor: float=0.5, liq_bonus: float=0.05, shocks: dict=None, w1: float=0.5, swapfee: float=0.0025):
+    """
+    Function applies every shock scenario to every strategy state and flags liquidations.
+
+    Each tick prices move first, then a position with CR at or above liq_cr is liquidated (close_factor
+    of the debt is repaid with collateral plus liq_bonus), then rebalances run with the same checks as
+    SimulateStrat once the CR or exposure has been out of range for more than latency ticks.
+
+    Parameters
+    ----------
+    tcr, min_cr, max_cr, e_thresh, te : float or np.ndarray
+        Strategy parameters, broadcast to one entry per set.
+    c, d, l : np.ndarray
+        Initial positions, e.g. the state of a SimulateStratBatch (defaults to the want state of t).
+    t : float
+        Initial total when c, d and l are not given.
+    liq_cr : float or np.ndarray
+        CR at which the lending protocol liquidates.
+    latency : int
+        Ticks the keeper needs before it can rebalance, 0 rebalances on the tick of the move.
+    close_factor, liq_bonus : float
+        Share of the debt repaid by a liquidation and collateral bonus paid to the liquidator.
+    shocks : dict
+        Scenario name: price changes per tick (defaults to scenarios).
+
+    Returns
+    -------
+    results : pd.DataFrame
+        One row per scenario and set with Liquidated, Liquidation Tick (first one, -1 if none),
+        Max CR, Final Total, Return and Rebalances.
+    """
+
+    shocks = scenarios if shocks is None else shocks
+    names = list(shocks.keys())
+
+    # Parameters per set
+    tcr, min_cr, max_cr, e_thresh, te, liq_cr = np.broadcast_arrays(*[np.atleast_1d(np.asarray(x, dtype=float)) for x in (tcr, min_cr, max_cr, e_thresh, te, liq_cr)])
+    if c is None:
+        c, d, l = want_state(t, tcr, te, w1)
+    c, d, l = np.broadcast_arrays(np.asarray(c, dtype=float), np.asarray(d, dtype=float), np.asarray(l, dtype=float), tcr)[:3]
+    n_sets = len(tcr)
+
+    # Price changes padded to the longest scenario, shape (ticks, scenarios, 1)
+    _len = max(len(v) for v in shocks.values())
+    pricechange = np.zeros((_len, len(names), 1))
+    for j, k in enumerate(names):
+        pricechange[:len(shocks[k]), j, 0] = shocks[k]
+
+    # State per scenario and set
+    _shape = (len(names), n_sets)
+    c, d, l = [np.broadcast_to(x, _shape).copy() for x in (c, d, l)]
+    t_initial = c - d + l
+    cr_max = d/c
+    liquidated = np.zeros(_shape, dtype=bool)
+    liq_tick = np.full(_shape, -1)
+    n_rebal = np.zeros(_shape, dtype=np.int64)
+    e_timer = np.zeros(_shape, dtype=np.int64)
+    cr_timer = np.zeros(_shape, dtype=np.int64)
+
+    for i, p in enumerate(pricechange):
+        # Price move
+        d *= 1 + p
+        l *= (1 + p)**w1
+        _cr, _e = get_state(c, d, l, w1)
+        np.maximum(cr_max, _cr, out=cr_max)
+
+        # Liquidation before the keeper can act
+        _liq = _cr >= liq_cr
+        if _liq.any():
+            liq_tick = np.where(_liq & ~liquidated, i, liq_tick)
+            liquidated |= _liq
+            _repay = np.where(_liq, close_factor*d, 0)
+            d -= _repay
+            c -= _repay*(1 + liq_bonus)
+            _cr, _e = get_state(c, d, l, w1)
+
+        # Check if exposure needs to be rebalanced
+        e_timer = np.where(np.abs(te - _e) > e_thresh, e_timer + 1, 0)
+        _e_rebal = e_timer > latency
+        if _e_rebal.any():
+            _, _, _c, _d, _l = exposure_rebal(c, d, l, te, w1, swapfee)
+            c, d, l = np.where(_e_rebal, _c, c), np.where(_e_rebal, _d, d), np.where(_e_rebal, _l, l)
+            e_timer[_e_rebal] = 0
+            _cr, _e = get_state(c, d, l, w1)
+
+        # Check if collateral needs to be rebalanced
+        cr_timer = np.where((_cr > max_cr) | (_cr < min_cr), cr_timer + 1, 0)
+        _cr_rebal = cr_timer > latency
+        if _cr_rebal.any():
+            _, _c, _d, _l = cr_rebal(c, d, l, tcr)
+            c, d, l = np.where(_cr_rebal, _c, c), np.where(_cr_rebal, _d, d), np.where(_cr_rebal, _l, l)
+            cr_timer[_cr_rebal] = 0
+        n_rebal += _e_rebal | _cr_rebal
+
+    _t = c - d + l
+    return pd.DataFrame({
+        'Scenario': np.repeat(names, n_sets),
+        'Set': np.tile(np.arange(n_sets), len(names)),
+        'Liquidated': liquidated.ravel(),
+        'Liquidation Tick': liq_tick.ravel(),
+        'Max CR': cr_max.ravel(),
+        'Final Total': _t.ravel(),
+        'Return': (_t/t_initial - 1).ravel(),
+        'Rebalances': n_rebal.ravel()
+    })
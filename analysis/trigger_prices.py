@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+from .dynamic_hedging_sims import get_state, update_all
+
+#=========================================#
+# TRIGGER PRICES
+
+# Functions
+#   Price multiples where CR leaves its band
+#   Price multiples where exposure leaves its band
+#   Trigger price bands
+#   Trigger price bands from on-chain state
+
+# NOTE: a price multiple x moves the positions like update_all without yields (c, d*x, l*x**w), so
+# CR is d*x/c and the exposure of get_state is a quadratic in sqrt(x) for w=0.5
+# NOTE: only w=0.5 (UniswapV2 pools, as the strategy contract) has a closed form, other weights raise
+# NOTE: with a refresh horizon the band is also computed on the positions after accruing yields over
+# it and the narrowest edges are kept, so the band holds until the next refresh
+#=========================================#
+
+MINUTES_PER_YEAR = 365*24*60
+
+# Strategy reads used by chain_bands, same keys as the stratinfo multicall
+CHAIN_READS = ['getCollateralBalance', 'getDebtBalance', 'lpBalance', 'minCollatRatio', 'maxCollatRatio',
+               'targetExposure', 'exposureThresh', 'chainlinkPrice']
+
+
+# Price multiples where CR leaves its band
+def cr_triggers(c, d, min_cr, max_cr):
+    """
+    Function returns the price multiples at which CR reaches min_cr and max_cr (inf when there is no debt).
+    """
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(d > 0, min_cr*c/d, np.inf), np.where(d > 0, max_cr*c/d, np.inf)
+
+# Price multiples where exposure leaves its band
+def exposure_triggers(c, d, l, min_e, max_e, w: float=0.5):
+    """
+    Function returns the nearest price multiples below and above 1 at which the exposure reaches
+    min_e or max_e (0 and inf when it never does).
+
+    Exposure k at multiple x solves (1-k)*d*y**2 - (w-k)*l*y + k*c = 0 with y = sqrt(x), roots
+    where the strategy total is not positive are dropped.
+    """
+
+    if w != 0.5:
+        raise ValueError('exposure triggers only have a closed form for w=0.5')
+
+    roots = []
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for k in (min_e, max_e):
+            a = (1 - k)*d
+            b = (w - k)*l
+            _sq = np.sqrt(b*b - 4*a*k*c)
+            for y in ((b - _sq)/(2*a), (b + _sq)/(2*a)):
+                # No debt leaves the linear equation
+                y = np.where(a == 0, k*c/b, y)
+                x = y*y
+                roots.append(np.where((y > 0) & (c - d*x + l*y > 0), x, np.nan))
+    roots = np.stack(np.broadcast_arrays(*roots))
+
+    _lower = np.where(roots < 1, roots, -np.inf).max(axis=0)
+    _upper = np.where(roots > 1, roots, np.inf).min(axis=0)
+    return np.maximum(_lower, 0), _upper
+
+# Trigger price bands
+def trigger_bands(c, d, l, min_cr, max_cr, te, e_thresh, price=1.0, c_apr: float=0.0, d_apr: float=0.0, l_apr: float=0.0,
+                  refresh_min: float=0.0, w: float=0.5):
+    """
+    Function returns the variable token prices at which each strategy needs a rebalance.
+
+    Parameters
+    ----------
+    c, d, l : float or np.ndarray
+        Collateral, debt and LP values at price.
+    min_cr, max_cr, te, e_thresh : float or np.ndarray
+        Strategy parameters, CR must stay in [min_cr, max_cr] and exposure in te +- e_thresh.
+    price : float or np.ndarray
+        Current variable token price.
+    c_apr, d_apr, l_apr : float or np.ndarray
+        Position yields accrued over refresh_min.
+    refresh_min : float
+        Minutes until the bands are recomputed, 0 ignores yields.
+
+    Returns
+    -------
+    bands : pd.DataFrame
+        One row per strategy with CR, Exposure, In Band (False when a rebalance is already due), the
+        price edges of each check (CR Low, CR High, Exposure Low, Exposure High), the band (Low, High)
+        and the check each band edge comes from (Low Trigger, High Trigger).
+    """
+
+    c, d, l, min_cr, max_cr, te, e_thresh, price = np.broadcast_arrays(*[np.atleast_1d(np.asarray(x, dtype=float))
+                                                                        for x in (c, d, l, min_cr, max_cr, te, e_thresh, price)])
+    _cr, _e = get_state(c, d, l, w)
+
+    # Edges now and after accruing yields until the next refresh
+    states = [(c, d, l)]
+    if refresh_min > 0:
+        _years = refresh_min/MINUTES_PER_YEAR
+        states.append(update_all(c, d, l, c_apr*_years, d_apr*_years, l_apr*_years, 0, 0, w, 1-w))
+    cr_low, cr_high, e_low, e_high = np.zeros(len(c)), np.full(len(c), np.inf), np.zeros(len(c)), np.full(len(c), np.inf)
+    for _c, _d, _l in states:
+        _cr_low, _cr_high = cr_triggers(_c, _d, min_cr, max_cr)
+        _e_low, _e_high = exposure_triggers(_c, _d, _l, te - e_thresh, te + e_thresh, w)
+        cr_low, cr_high = np.maximum(cr_low, _cr_low), np.minimum(cr_high, _cr_high)
+        e_low, e_high = np.maximum(e_low, _e_low), np.minimum(e_high, _e_high)
+
+    # A strategy already out of its band is due at the current price
+    in_band = (_cr >= min_cr) & (_cr <= max_cr) & (np.abs(te - _e) <= e_thresh)
+    low = np.where(in_band, np.maximum(cr_low, e_low), 1.0)
+    high = np.where(in_band, np.minimum(cr_high, e_high), 1.0)
+    return pd.DataFrame({
+        'CR': _cr,
+        'Exposure': _e,
+        'In Band': in_band,
+        'CR Low': cr_low*price,
+        'CR High': cr_high*price,
+        'Exposure Low': e_low*price,
+        'Exposure High': e_high*price,
+        'Low': low*price,
+        'High': high*price,
+        'Low Trigger': np.where(cr_low >= e_low, 'Collateral', 'Exposure'),
+        'High Trigger': np.where(cr_high <= e_high, 'Collateral', 'Exposure')
+    })
+
+# Trigger price bands from on-chain state
+def chain_bands(reads, c_apr: float=0.0, d_apr: float=0.0, l_apr: float=0.0, refresh_min: float=0.0):
+    """
+    Function returns trigger_bands from StrategyV1StableVariable reads.
+
+    Parameters
+    ----------
+    reads : dict or pd.DataFrame
+        CHAIN_READS values of one strategy, or one row per strategy. Balances are in stable token units
+        (any common scale) and lpBalance is getLpBalance(True), as read by vault stratinfo. Band prices
+        are in chainlinkPrice terms, the oracle the strategy values its debt with.
+    c_apr, d_apr, l_apr, refresh_min :
+        Same as trigger_bands.
+    """
+
+    _missing = [k for k in CHAIN_READS if k not in reads]
+    if len(_missing) > 0:
+        raise ValueError('missing strategy reads {}'.format(_missing))
+    r = {k: np.asarray(reads[k], dtype=float) for k in CHAIN_READS}
+    return trigger_bands(r['getCollateralBalance'], r['getDebtBalance'], r['lpBalance'], r['minCollatRatio'], r['maxCollatRatio'],
+                         r['targetExposure'], r['exposureThresh'], r['chainlinkPrice'], c_apr, d_apr, l_apr, refresh_min)
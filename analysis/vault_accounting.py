@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+#=========================================#
+# VAULT ACCOUNTING
+
+# Functions
+#   Vault asset growth from a strategy run
+#   Simulate depositor cohorts
+
+# NOTE: mirrors the share accounting of ERC4626DynamicHedgingVault (price per share, deposit fee,
+# chargePerformanceFees) and the harvest fees of StrategyV1StableVariable
+# NOTE: the vault is only stepped on ticks where some cohort enters or exits, price per share
+# follows the strategy growth in between, and each step handles all cohorts of that tick at once
+# NOTE: integer rounding of the contracts is ignored
+#=========================================#
+
+# Contract constants
+DEPOSIT_FEE = 10/10000
+PERFORMANCE_FEE = 0.15
+SECONDARY_FEE = 500/10000
+STRATEGIST_FEE = 500/10000
+
+
+# Vault asset growth from a strategy run
+def vault_growth(strat, reward_apr: float=0.0, secondary_fee: float=SECONDARY_FEE, strategist_fee: float=STRATEGIST_FEE):
+    """
+    Function returns the growth of the vault assets per tick of a SimulateStrat run recorded with record='full'.
+
+    Parameters
+    ----------
+    strat : SimulateStrat
+        Strategy after run.
+    reward_apr : float
+        Part of the l_apr of the run paid as farming rewards. Harvests send secondary_fee of the rewards
+        to the lending vault and strategist_fee of the rest to the owner, so that share is taken out of
+        the strategy growth.
+    secondary_fee, strategist_fee : float
+        Harvest fees of the strategy contract.
+
+    Returns
+    -------
+    growth : np.ndarray
+        Vault assets at every tick per unit of assets at tick 0.
+    """
+
+    if getattr(strat, 'index_feed', None) is not None:
+        raise ValueError("vault growth needs every tick, run the strategy with record='full'")
+
+    t = np.asarray(strat.t_feed, dtype=float)
+    l = np.asarray(strat.l_feed, dtype=float)
+    _fee_share = secondary_fee + (1 - secondary_fee)*strategist_fee
+    _drag = l[:-1]/t[:-1]*reward_apr*strat.min_per_step/(365*24*60)*_fee_share
+    return np.concatenate(([1.0], np.cumprod(t[1:]/t[:-1] - _drag)))
+
+# Simulate depositor cohorts
+def simulate_cohorts(growth: np.ndarray, entry, exit, amount=1.0, deposit_fee: float=DEPOSIT_FEE, performance_fee: float=PERFORMANCE_FEE):
+    """
+    Function runs the vault share accounting for depositor cohorts entering and exiting at different ticks.
+
+    Each cohort deposits amount at its entry tick (minting shares at the price per share less the
+    deposit fee, which stays in the vault) and redeems all its shares at its exit tick, paying
+    performance_fee of its share gain to the owner as shares. Deposits of a tick are processed
+    before its redemptions.
+
+    Parameters
+    ----------
+    growth : np.ndarray
+        Vault assets per unit of assets at tick 0, e.g. from vault_growth.
+    entry, exit : np.ndarray
+        Entry and exit tick of every cohort, exit must be after entry.
+    amount : float or np.ndarray
+        Assets deposited by every cohort.
+    deposit_fee, performance_fee : float
+        Vault fees.
+
+    Returns
+    -------
+    cohorts : pd.DataFrame
+        One row per cohort with the shares, entry and exit price per share, the performance fee,
+        the assets withdrawn and the net return.
+    vault : pd.DataFrame
+        Assets, supply, price per share and owner shares after every tick with entries or exits.
+    """
+
+    growth = np.asarray(growth, dtype=float)
+    entry, exit, amount = np.broadcast_arrays(np.asarray(entry, dtype=np.int64), np.asarray(exit, dtype=np.int64), np.asarray(amount, dtype=float))
+    if (exit <= entry).any() or entry.min() < 0 or exit.max() >= len(growth):
+        raise ValueError('cohorts need 0 <= entry < exit < len(growth)')
+
+    # Ticks with entries or exits, cohorts grouped by them
+    ticks = np.unique(np.concatenate([entry, exit]))
+    entry_event = np.searchsorted(ticks, entry)
+    exit_event = np.searchsorted(ticks, exit)
+    deposits = np.bincount(entry_event, weights=amount, minlength=len(ticks))
+    _order = np.argsort(exit_event, kind='stable')
+    _bounds = np.searchsorted(exit_event[_order], np.arange(len(ticks)+1))
+
+    # Vault state
+    assets = 0.0
+    supply = 0.0
+    owner_shares = 0.0
+    entry_pps = np.zeros(len(ticks))
+    exit_pps = np.zeros(len(ticks))
+    shares = np.zeros(len(entry))
+    fee_shares = np.zeros(len(entry))
+    rows = []
+
+    prev = ticks[0]
+    for i, tick in enumerate(ticks):
+        # Strategy growth since the last event
+        assets *= growth[tick]/growth[prev]
+        prev = tick
+        pps = assets/supply if assets > 0 and supply > 0 else 1.0
+
+        # Deposits, minted shares are charged the deposit fee
+        entry_pps[i] = pps
+        if deposits[i] > 0:
+            assets += deposits[i]
+            supply += deposits[i]/pps*(1 - deposit_fee)
+
+        # Redemptions, performance fee shares go to the owner
+        _idx = _order[_bounds[i]:_bounds[i+1]]
+        if len(_idx) > 0:
+            _pps = assets/supply
+            exit_pps[i] = _pps
+            _shares = amount[_idx]/entry_pps[entry_event[_idx]]*(1 - deposit_fee)
+            _entry = entry_pps[entry_event[_idx]]
+            _fee = np.where(_entry < _pps, _shares*(1 - _entry/_pps)*performance_fee, 0.0)
+            shares[_idx] = _shares
+            fee_shares[_idx] = _fee
+            owner_shares += _fee.sum()
+            supply -= (_shares - _fee).sum()
+            assets -= ((_shares - _fee)*_pps).sum()
+
+        rows.append((tick, assets, supply, assets/supply if supply > 0 else np.nan, owner_shares))
+
+    _exit_pps = exit_pps[exit_event]
+    withdrawn = (shares - fee_shares)*_exit_pps
+    cohorts = pd.DataFrame({
+        'Entry': entry,
+        'Exit': exit,
+        'Deposit': amount,
+        'Shares': shares,
+        'Entry Price': entry_pps[entry_event],
+        'Exit Price': _exit_pps,
+        'Performance Fee': fee_shares*_exit_pps,
+        'Withdrawn': withdrawn,
+        'Net Return': withdrawn/amount - 1
+    })
+    vault = pd.DataFrame(rows, columns=['Tick', 'Assets', 'Supply', 'Price Per Share', 'Owner Shares']).set_index('Tick')
+    return cohorts, vault
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+
+import pandas as pd
+import numpy as np
+
+from .dynamic_hedging_sims import SimulateStrat, SimulateStratBatch, param_grid
+
+#=========================================#
+# WALK FORWARD OPTIMIZATION
+
+# Functions
+#   Rolling train/test windows
+#   Worker setup (attach shared price changes)
+#   Optimize train window
+#   Walk forward
+
+# NOTE: train windows are independent and optimized in parallel with SimulateStratBatch,
+# test windows are then run in order by one SimulateStrat so its state carries over
+# NOTE: price changes are computed once and shared by every train window
+#=========================================#
+
+# Worker state, set by _init_worker
+_shm = None
+_pricechange = None
+
+
+# Rolling train/test windows
+def rolling_windows(n: int, train_size: int, test_size: int):
+    """
+    Function returns the rolling train and test windows over a price feed.
+
+    Parameters
+    ----------
+    n : int
+        Number of prices.
+    train_size : int
+        Prices per train window.
+    test_size : int
+        Price changes per test window, windows move forward by test_size.
+
+    Returns
+    -------
+    windows : list[tuple]
+        (train_start, train_end, test_end) price indices. Train window is prices[train_start:train_end],
+        test window is prices[train_end-1:test_end] so it starts from the last train price.
+    """
+
+    if train_size < 2 or test_size < 1:
+        raise ValueError('train_size must be at least 2 and test_size at least 1')
+    windows = []
+    for s in range(0, n - train_size, test_size):
+        windows.append((s, s + train_size, min(s + train_size + test_size, n)))
+    return windows
+
+# Worker setup
+def _init_worker(shm_name: str, n: int):
+    global _shm, _pricechange
+    _shm = SharedMemory(name=shm_name)
+    _pricechange = np.ndarray((n,), dtype=np.float64, buffer=_shm.buf)
+
+# Optimize train window
+def _optimize_window(pricechange: np.ndarray, lo: int, hi: int, grid: dict, objective, t: float, te: float, strat_kwargs: dict, run_kwargs: dict):
+    strat = SimulateStratBatch(t, grid['tcr'], te, **strat_kwargs)
+    results = strat.run(None, max_cr=grid['max_cr'], e_thresh=grid['e_thresh'], min_cr=grid['min_cr'],
+                        pricechange=pricechange[lo:hi-1], **run_kwargs)
+    score = objective(results) if callable(objective) else results[objective]
+    best = int(np.nanargmax(np.asarray(score, dtype=float)))
+    return best, float(np.asarray(score)[best])
+
+def _optimize_shared_window(*args):
+    return _optimize_window(_pricechange, *args)
+
+# Walk forward
+def walk_forward(pricefeed: list[float], train_size: int, test_size: int, c_apr: float, d_apr: float, l_apr: float, min_per_step: float,
+                 tcr: list[float], min_cr: list[float], max_cr: list[float], e_thresh: list[float], te: float=0.0, t: float=1000,
+                 w1: float=0.5, w2: float=0.5, swapfee: float=0.0025, objective='Annualized Return', processes: int=1):
+    """
+    Function picks the best parameters on each train window and runs them forward on the following test window.
+
+    Parameters
+    ----------
+    pricefeed : list[float]
+        Variable token prices.
+    train_size, test_size : int
+        Window sizes, see rolling_windows.
+    c_apr, d_apr, l_apr : float
+        Collateral, debt and LP APRs.
+    min_per_step : float
+        Minutes between prices.
+    tcr, min_cr, max_cr, e_thresh : list[float]
+        Values to combine into the grid, combinations without min_cr < tcr < max_cr are skipped.
+    te : float
+        Target exposure.
+    t : float
+        Initial strategy total.
+    objective : str or callable
+        SimulateStratBatch.results column to maximize, or a function of the results returning
+        one score per parameter set (higher is better).
+    processes : int
+        Number of worker processes for the train windows.
+
+    Returns
+    -------
+    windows : pd.DataFrame
+        One row per window with the chosen parameters, the train score and the test results.
+    equity : pd.Series
+        Strategy total over every test tick, indexed by price index.
+    """
+
+    prices = np.asarray(pricefeed, dtype=float)
+    windows = rolling_windows(len(prices), train_size, test_size)
+    if len(windows) == 0:
+        raise ValueError('pricefeed is shorter than train_size + 1')
+
+    # Drop parameter sets that would rebalance on every tick
+    grid = param_grid(tcr=tcr, min_cr=min_cr, max_cr=max_cr, e_thresh=e_thresh)
+    _valid = (grid['min_cr'] < grid['tcr']) & (grid['tcr'] < grid['max_cr'])
+    if not _valid.any():
+        raise ValueError('no parameter set with min_cr < tcr < max_cr')
+    grid = {k: v[_valid] for k, v in grid.items()}
+
+    strat_kwargs = {'w1': w1, 'w2': w2, 'swapfee': swapfee}
+    run_kwargs = {'c_apr': c_apr, 'd_apr': d_apr, 'l_apr': l_apr, 'min_per_step': min_per_step}
+    tasks = [(lo, hi, grid, objective, t, te, strat_kwargs, run_kwargs) for lo, hi, _ in windows]
+
+    # Price changes are computed once, workers get them through shared memory
+    pricechange = np.diff(prices) / np.abs(prices[:-1])
+    if processes == 1:
+        best = [_optimize_window(pricechange, *task) for task in tasks]
+    else:
+        shm = SharedMemory(create=True, size=max(pricechange.nbytes, 1))
+        try:
+            np.ndarray(pricechange.shape, dtype=np.float64, buffer=shm.buf)[:] = pricechange
+            with Pool(processes, initializer=_init_worker, initargs=(shm.name, len(pricechange))) as pool:
+                best = pool.starmap(_optimize_shared_window, tasks)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    # Run test windows in order with the state carried over
+    strat = SimulateStrat(t, grid['tcr'][best[0][0]], te, w1, w2, swapfee)
+    rows = []
+    equity = []
+    for (lo, hi, end), (i, score) in zip(windows, best):
+        strat.tcr = grid['tcr'][i]
+        strat.run(prices[hi-1:end], max_cr=grid['max_cr'][i], e_thresh=grid['e_thresh'][i], min_cr=grid['min_cr'][i], mode='fast', **run_kwargs)
+        stats = strat.sim_stats()
+        equity.append(strat.t_feed if len(equity) == 0 else strat.t_feed[1:])
+        rows.append({
+            'Train Start': lo,
+            'Train End': hi,
+            'Test End': end,
+            'tcr': grid['tcr'][i],
+            'min_cr': grid['min_cr'][i],
+            'max_cr': grid['max_cr'][i],
+            'e_thresh': grid['e_thresh'][i],
+            'Train Score': score,
+            'Test Initial': stats['Initial'],
+            'Test Final': stats['Final'],
+            'Test Return': stats['Return'],
+            'Test Max Drawdown': stats['Max Drawdown'],
+            'Test Rebalances': stats['Collateral'] + stats['Exposure'] + stats['Both']
+        })
+
+    equity = pd.Series(np.concatenate(equity), index=np.arange(windows[0][1]-1, windows[-1][2]), name='Total')
+    return pd.DataFrame(rows), equity
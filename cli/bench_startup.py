@@ -0,0 +1,73 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+#=========================================#
+# CLI STARTUP BENCHMARK
+
+# Functions
+#   Time vault --help in a fresh interpreter
+#   Command line entry point
+
+# NOTE: run with python bench_startup.py from the cli folder, exits with 1 when vault --help is
+# slower than --max-seconds or imports any of the heavy modules
+#=========================================#
+
+HEAVY_MODULES = ['ape', 'web3', 'eth_abi', 'eth_utils', 'questionary']
+
+# Runs in the child interpreter, prints the seconds to import vault and show the help and the heavy modules loaded
+_SCRIPT = '''
+import io, sys, time, contextlib
+_start = time.perf_counter()
+import vault
+with contextlib.redirect_stdout(io.StringIO()):
+    try:
+        vault.cli(['--help'])
+    except SystemExit:
+        pass
+    for _name in vault.cli.list_commands(None):
+        vault.cli.get_command(None, _name).get_help(vault.click.Context(vault.cli.get_command(None, _name)))
+print(time.perf_counter() - _start)
+print(','.join(m for m in {heavy} if m in sys.modules))
+'''
+
+# Time vault --help in a fresh interpreter
+def time_startup(repeat: int=5):
+    """
+    Function returns the median seconds to import vault and render the help of the group and every
+    command over repeat fresh interpreters, the interpreter start up is not included. Also returns
+    the heavy modules that were imported.
+    """
+
+    _cwd = os.path.dirname(os.path.abspath(__file__))
+    times, imported = [], set()
+    for _ in range(repeat):
+        _out = subprocess.run([sys.executable, '-c', _SCRIPT.format(heavy=HEAVY_MODULES)], cwd=_cwd,
+                              capture_output=True, text=True, check=True).stdout.splitlines()
+        times.append(float(_out[0]))
+        imported.update(m for m in _out[1].split(',') if m != '')
+    return statistics.median(times), sorted(imported)
+
+# Command line entry point
+def main(argv: list[str]=None):
+    parser = argparse.ArgumentParser(description='Guard the start up time of the vault cli.')
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters to time, the median is reported')
+    parser.add_argument('--max-seconds', type=float, default=0.3, help='Fail above this start up time')
+    args = parser.parse_args(argv)
+
+    seconds, imported = time_startup(args.repeat)
+    print('vault --help: {:0.3f}s (limit {:0.3f}s)'.format(seconds, args.max_seconds))
+    failures = []
+    if seconds > args.max_seconds:
+        failures.append('start up took {:0.3f}s'.format(seconds))
+    if len(imported) > 0:
+        failures.append('heavy modules imported at start up: {}'.format(', '.join(imported)))
+    for f in failures:
+        print('STARTUP REGRESSION: '+f)
+    return 1 if len(failures) > 0 else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
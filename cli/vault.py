@@ -1,35 +1,182 @@
 import click
 from click import Context
-from ape import networks
-from ape.cli import network_option, account_option, ape_cli_context
 import decimal
+import functools
+import json
+import os
+import time
 from decimal import Decimal
-from web3 import Web3, constants
-import questionary
+
+# NOTE: ape, web3 and questionary are slow to import, they are only imported inside the commands
+# and options that use them so vault --help and the command registration stay fast (see bench_startup.py)
 
 # Set common variables
-max_uint = Web3.toInt(hexstr=constants.MAX_INT) 
+max_uint = 2**256 - 1
 gas_price=200
 gas_limit=7000000
 ln_break = '\n-------------------'
 
+# Multicall3 is deployed at this address on most chains, deploy contracts/Multicall.vy on local networks
+multicall_address = '0xcA11bde05977b3631167028862bE2a173976CA11'
+multicall_batch = 100
+
+# Metadata cache file, override with the VAULT_CACHE environment variable
+cache_path = os.environ.get('VAULT_CACHE', os.path.join(os.path.expanduser('~'), '.findec', 'vault_cache.json'))
+
+# Strategy values only set in the constructor (lpToken changes with set_uniswap_interfaces)
+strat_immutables = ['stratName', 'vault', 'lendingvault', 'stableToken', 'variableToken', 'aToken', 'debtToken', 'rewardToken']
+
+# Metadata cache
+class MetadataCache:
+    """
+    On-disk cache of contract metadata that never changes (decimals, asset and token addresses) and of
+    resolved deployment addresses, keyed by chain id and contract address ('deployments' for the latter).
+    Entries are only removed explicitly with vault cache clear.
+    """
+    def __init__(self, path=cache_path):
+        self.path = path
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            try:
+                with open(self.path) as f:
+                    self._data = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._data = {}
+        return self._data
+
+    def get(self, chain_id, address, key):
+        return self.data.get(str(chain_id), {}).get(str(address), {}).get(key)
+
+    def put(self, chain_id, address, values: dict):
+        if len(values) == 0:
+            return
+        self.data.setdefault(str(chain_id), {}).setdefault(str(address), {}).update(values)
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        _tmp = self.path+'.tmp'
+        with open(_tmp, 'w') as f:
+            json.dump(self.data, f, indent=2, sort_keys=True)
+        os.replace(_tmp, self.path)
+
+    def clear(self, chain_id=None, address=None):
+        """
+        Removes every entry, or only the ones of chain_id and/or address. Returns the number of contracts removed.
+        """
+        removed = 0
+        for _chain in list(self.data.keys()):
+            if chain_id is not None and _chain != str(chain_id):
+                continue
+            for _address in list(self.data[_chain].keys()):
+                if address is None or _address.lower() == address.lower():
+                    del self.data[_chain][_address]
+                    removed += 1
+            if len(self.data[_chain]) == 0:
+                del self.data[_chain]
+        self.save()
+        return removed
+
+metadata = MetadataCache()
+
 # Helper functions
+def metadata_chain():
+    """
+    Returns the chain id metadata is cached under, None on local and fork networks since their contracts are redeployed.
+    """
+    from ape import networks
+    _name = networks.provider.network.name
+    if _name == 'local' or _name.endswith('-fork'):
+        return None
+    return networks.provider.chain_id
+
+def cached_call(contract, method):
+    """
+    Returns contract.method() from the metadata cache, calling the contract only on a miss.
+    Only use it for values that never change.
+    """
+    _chain = metadata_chain()
+    if _chain is None:
+        return getattr(contract, method)()
+    value = metadata.get(_chain, contract.address, method)
+    if value is None:
+        value = getattr(contract, method)()
+        metadata.put(_chain, contract.address, {method: value})
+    return value
+
+def latest_deployment(context, name):
+    """
+    Returns the latest deployment of the project contract name, its address is cached.
+    """
+    _container = getattr(context.project_manager, name)
+    _chain = metadata_chain()
+    address = None if _chain is None else metadata.get(_chain, 'deployments', name)
+    if address is None:
+        address = context.chain_manager.contracts.get_deployments(_container)[-1].address
+        if _chain is not None:
+            metadata.put(_chain, 'deployments', {name: str(address)})
+    return _container.at(address)
+
 def get_token_balance(token, account):
     bal = token.balanceOf(account)
-    decimals = token.decimals()
+    decimals = cached_call(token, 'decimals')
     return bal/(10**decimals)
 
 def update_gasprice(ctx, param, value):
     return value*10**9
 
+def multicall(reads, address=multicall_address, block=None):
+    """
+    Runs view calls through Multicall3 aggregate3, multicall_batch calls per eth_call and all pinned to one block.
+    reads maps a key to (contract, method name, *args). Returns the decoded value per key (None if the call
+    reverted) and the block number.
+    """
+    from ape import networks
+    from eth_abi import encode, decode
+    from eth_utils import keccak, to_checksum_address
+
+    web3 = networks.provider.web3
+    if block is None:
+        block = web3.eth.block_number
+    
+    # Encode calls with the contract abis
+    keys, calls, outputs = [], [], []
+    for k, (contract, method, *args) in reads.items():
+        abi = [m for m in contract.contract_type.view_methods if m.name == method and len(m.inputs) == len(args)][0]
+        _inputs = [i.canonical_type for i in abi.inputs]
+        _selector = keccak(text='{}({})'.format(method, ','.join(_inputs)))[:4]
+        keys.append(k)
+        calls.append((contract.address, True, _selector + encode(_inputs, list(args))))
+        outputs.append([o.canonical_type for o in abi.outputs])
+    
+    # One eth_call per batch
+    values = {}
+    _selector = keccak(text='aggregate3((address,bool,bytes)[])')[:4]
+    for s in range(0, len(calls), multicall_batch):
+        _data = _selector + encode(['(address,bool,bytes)[]'], [calls[s:s+multicall_batch]])
+        _ret = web3.eth.call({'to': address, 'data': '0x'+_data.hex()}, block)
+        _results = decode(['(bool,bytes)[]'], bytes(_ret))[0]
+        for k, _types, (success, data) in zip(keys[s:s+multicall_batch], outputs[s:s+multicall_batch], _results):
+            if success == False:
+                values[k] = None
+                continue
+            _values = [to_checksum_address(v) if t == 'address' else v for t, v in zip(_types, decode(_types, data))]
+            values[k] = _values[0] if len(_values) == 1 else _values
+    return values, block
+
 # Network bound command
 class NetworkCommand(click.Command):
     """
-    A command that uses the :meth:`~ape.cli.options.network_option`.
+    A command that uses the group network_option.
     It will automatically set the network for the duration of the command execution.
     """
     def invoke(self, ctx: Context):
+        from ape import networks
         value = ctx.obj.get("network") or networks.default_ecosystem.name
+        print('\nUsing Network: {}'.format(value)+ln_break)
         with networks.parse_network_choice(value):
             super().invoke(ctx)
         
@@ -41,6 +188,7 @@ class QuestionaryOption(click.Option):
             raise Exception('ChoiceOption type arg must be click.Choice')
 
     def prompt_for_value(self, ctx):
+        import questionary
         val = questionary.select(self.prompt, choices=self.type.choices).unsafe_ask()
         return val
 
@@ -51,12 +199,34 @@ def gasprice_option():
 def gaslimit_option():
     return click.option('--gaslimit', default=gas_limit, show_default=True, help="Gas limit used for sending tx.")
 
+# Lazy replacements of the ape cli options, ape is only imported once a command runs
+def network_option():
+    return click.option('--network', type=click.STRING, default=None, help="Ecosystem:network:provider to connect to (defaults to the ape default ecosystem).")
+
+def load_account(ctx, param, value):
+    from ape.cli.choices import AccountAliasPromptChoice
+    choice = AccountAliasPromptChoice()
+    if value is None:
+        return choice.select_account()
+    return choice.convert(value, param, ctx)
+
+def account_option():
+    return click.option('--account', type=click.STRING, default=None, callback=load_account, help="Account alias used to sign tx (prompts if not given).")
+
+def ape_cli_context():
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            from ape.cli import ApeCliContextObject
+            return f(ApeCliContextObject(), *args, **kwargs)
+        return wrapper
+    return decorator
+
 # Group command     
 @click.group()
 @network_option()
 @click.pass_context
 def cli(ctx, network):
-    print('\nUsing Network: {}'.format(network)+ln_break)
     ctx.obj = {
         'network': network
     }
@@ -90,16 +260,15 @@ def balances(context, account):
 @gaslimit_option()
 def vaults(context, account, vault, action, address, gasprice, gaslimit):
     _project = context.project_manager
-    _chain = context.chain_manager 
     # Set selected vault
     if vault == 'DYNAMIC':
         if address == '':
-            vlt = _chain.contracts.get_deployments(_project.ERC4626DynamicHedgingVault)[-1]
+            vlt = latest_deployment(context, 'ERC4626DynamicHedgingVault')
         else:
             vlt = _project.ERC4626LendingVault.at(address)
     elif vault == 'LENDING':
         if address == '':
-            vlt = _chain.contracts.get_deployments(_project.ERC4626LendingVault)[-1]
+            vlt = latest_deployment(context, 'ERC4626LendingVault')
         else:
             vlt = _project.ERC4626LendingVault.at(address)
     print('\nInteracting with {} vault'.format(vault)+ln_break)   
@@ -107,14 +276,14 @@ def vaults(context, account, vault, action, address, gasprice, gaslimit):
     # Print User Vault Details
     _price_per_share = vlt.pricePerShare()
     _shares = vlt.balanceOf(account)
-    _decimals = vlt.decimals()
+    _decimals = cached_call(vlt, 'decimals')
     _balance = Decimal(_shares/10**_decimals)*_price_per_share
     print('Current Balance in Vault: $ {:0.4f}'.format(_balance))
     print('Price per Share: {:0.4f}'.format(_price_per_share))
     
     
     # Check if user approved vault asset for transfer
-    _asset = vlt.asset()
+    _asset = cached_call(vlt, 'asset')
     asset = _project.ERC20.at(_asset)
     _allowance = asset.allowance(account, vlt.address)
     if _allowance == 0:
@@ -124,7 +293,7 @@ def vaults(context, account, vault, action, address, gasprice, gaslimit):
     
     # Display Vault State
     if action == 'DISPLAY':
-        _name = vlt.name()
+        _name = cached_call(vlt, 'name')
         _supply = vlt.totalSupply()
         _assets = vlt.totalAssets()
         print('\nVault Details'+ln_break)   
@@ -136,7 +305,7 @@ def vaults(context, account, vault, action, address, gasprice, gaslimit):
             
     # Deposit logic
     if action == 'DEPOSIT':
-        asset_decimals = asset.decimals()
+        asset_decimals = cached_call(asset, 'decimals')
         asset_bal = get_token_balance(asset, account)
         print('\nDeposit into Vault'+ln_break) 
         print('Current Asset balance: {:0.2f}'.format(asset_bal))
@@ -161,72 +330,102 @@ def vaults(context, account, vault, action, address, gasprice, gaslimit):
 @click.option("--state", is_flag=True, show_default=True, help="Display strategy positions state")
 @click.option("--params", is_flag=True, show_default=True, help="Display strategy key parameters")
 @click.option("--norm-values", is_flag=True, show_default=True, default=True, help="To display balances normalized by decimals")
-def stratinfo(context, address, info, state, params, norm_values):
+@click.option('--multicall', 'multicall_addr', type=click.STRING, default=multicall_address, show_default=True, help="Multicall3 compatible contract used to batch reads")
+@click.option('--block', type=click.INT, default=None, help="Block to read the strategy at (defaults to latest)")
+def stratinfo(context, address, info, state, params, norm_values, multicall_addr, block):
     _project = context.project_manager
-    _chain = context.chain_manager 
     if address == '':
-        dyn = _chain.contracts.get_deployments(_project.StrategyV1StableVariable)[-1]
+        dyn = latest_deployment(context, 'StrategyV1StableVariable')
     else:
         dyn = _project.StrategyV1StableVariable.at(address)
     
+    # Group all reads so they come from one block
+    reads = {k: (dyn, k) for k in ['stratName', 'owner', 'vault', 'lendingvault', 'stableToken']}
+    if info == True:
+        reads.update({k: (dyn, k) for k in ['uniswap_factory', 'uniswap_router', 'aave_provider', 'aave_lending_pool', 'aave_oracle', 'masterchef', 
+                                            'poolid', 'aToken', 'variableToken', 'debtToken', 'lpToken', 'rewardToken']})
+    
+    # Immutable values come from the metadata cache
+    _chain = metadata_chain()
+    cached = {}
+    if _chain is not None:
+        cached = {k: metadata.get(_chain, dyn.address, k) for k in strat_immutables if k in reads}
+        cached = {k: v for k, v in cached.items() if v is not None}
+    reads = {k: v for k, v in reads.items() if k not in cached}
+    if state == True:
+        reads.update({k: (dyn, k) for k in ['totalBalance', 'getIdleBalance', 'deployedBalance', 'getCollateralBalance', 'getDebtBalance', 
+                                            'targetCollatRatio', 'getCollateralRatio', 'minCollatRatio', 'maxCollatRatio', 'targetExposure', 
+                                            'getExposure', 'exposureThresh']})
+        reads['lpBalance'] = (dyn, 'getLpBalance', True)
+        reads['chainlinkPrice'] = (dyn, 'get_variable_price', 1)
+        reads['lpPrice'] = (dyn, 'get_variable_price', 2)
+    if params == True:
+        reads.update({k: (dyn, k) for k in ['maxAllowedCollatRatio', 'shortAllowedExposure', 'longAllowedExposure', 'slippage', 'strategistFee', 
+                                            'secondaryFee', 'priceProtectionPerc']})
+    r, block = multicall(reads, multicall_addr, block)
+    if _chain is not None:
+        metadata.put(_chain, dyn.address, {k: r[k] for k in strat_immutables if r.get(k) is not None})
+    r.update(cached)
+    
     # Print strategy base info
     print('\nBase Info'+ln_break)
-    print('Name: {}'.format(dyn.stratName()))
+    print('Block: {}'.format(block))
+    print('Name: {}'.format(r['stratName']))
     print('Address: {}'.format(dyn.address))
-    print('Owner: {}'.format(dyn.owner()))
-    print('Vault: {}'.format(dyn.vault()))
-    print('Lending Vault: {}'.format(dyn.lendingvault()))
+    print('Owner: {}'.format(r['owner']))
+    print('Vault: {}'.format(r['vault']))
+    print('Lending Vault: {}'.format(r['lendingvault']))
     
     # Print strategy detailed info
     if info == True:
         print('\nDetailed Info'+ln_break)
         print('UniswapV2 Contracts:')
-        print(' -> Factory: {} , Router: {}'.format(dyn.uniswap_factory(), dyn.uniswap_router()))
+        print(' -> Factory: {} , Router: {}'.format(r['uniswap_factory'], r['uniswap_router']))
         print('AaveV2 Contracts:')
-        print(' -> Provider: {} , Lending Pool: {} , Oracle: {}'.format(dyn.aave_provider(), dyn.aave_lending_pool(), dyn.aave_oracle()))
+        print(' -> Provider: {} , Lending Pool: {} , Oracle: {}'.format(r['aave_provider'], r['aave_lending_pool'], r['aave_oracle']))
         print('MasterchefV2 Contract:')
-        print(' -> Masterchef: {} , PoolId: {}'.format(dyn.masterchef(), dyn.poolid()))     
+        print(' -> Masterchef: {} , PoolId: {}'.format(r['masterchef'], r['poolid']))     
         print('Tokens:')
-        print(' -> Stable: {} , aStable: {}'.format(dyn.stableToken(), dyn.aToken()))
-        print(' -> Variable: {} , debtVariable: {}'.format(dyn.variableToken(), dyn.debtToken()))
-        print(' -> LP: {} , Reward: {}'.format(dyn.lpToken(), dyn.rewardToken()))
+        print(' -> Stable: {} , aStable: {}'.format(r['stableToken'], r['aToken']))
+        print(' -> Variable: {} , debtVariable: {}'.format(r['variableToken'], r['debtToken']))
+        print(' -> LP: {} , Reward: {}'.format(r['lpToken'], r['rewardToken']))
         #print(' -> Secondary: {} , aSecondary: {}'.format(dyn.secondaryToken(), dyn.secondaryaToken()))
 
     # Print strategy state
     if state == True:
         if norm_values == True:
-            _token = _project.ERC20.at(dyn.stableToken())
-            _d = 10**int(_token.decimals())
+            _token = _project.ERC20.at(r['stableToken'])
+            _d = 10**int(cached_call(_token, 'decimals'))
         else:
             _d = 1
         print('\nStrategy State'+ln_break)
         print('Positions Balances:')
-        print(' -> Total: {:0.4f}'.format(dyn.totalBalance()/_d))
-        print(' -> Idle: {:0.4f} , Deployed: {:0.4f}'.format(dyn.getIdleBalance()/_d, dyn.deployedBalance()/_d))
-        print(' -> Collateral: {:0.4f} , Debt: {:0.4f} , LP: {:0.4f}'.format(dyn.getCollateralBalance()/_d, dyn.getDebtBalance()/_d, dyn.getLpBalance(True)/_d))
+        print(' -> Total: {:0.4f}'.format(r['totalBalance']/_d))
+        print(' -> Idle: {:0.4f} , Deployed: {:0.4f}'.format(r['getIdleBalance']/_d, r['deployedBalance']/_d))
+        print(' -> Collateral: {:0.4f} , Debt: {:0.4f} , LP: {:0.4f}'.format(r['getCollateralBalance']/_d, r['getDebtBalance']/_d, r['lpBalance']/_d))
         print('Collateral Ratio State:')
-        print(' -> Target Collateral Ratio: {:0.4f}'.format(dyn.targetCollatRatio()))
-        print(' -> Current Collateral Ratio: {:0.4f}'.format(dyn.getCollateralRatio()))
-        print(' -> Min Collateral Ratio: {:0.4f} , Max Collateral Ratio: {:0.4f}'.format(dyn.minCollatRatio(), dyn.maxCollatRatio()))
+        print(' -> Target Collateral Ratio: {:0.4f}'.format(r['targetCollatRatio']))
+        print(' -> Current Collateral Ratio: {:0.4f}'.format(r['getCollateralRatio']))
+        print(' -> Min Collateral Ratio: {:0.4f} , Max Collateral Ratio: {:0.4f}'.format(r['minCollatRatio'], r['maxCollatRatio']))
         print('Exposure State:')
-        print(' -> Target Exposure: {:0.4f}'.format(dyn.targetExposure()))
-        print(' -> Current Exposure: {:0.4f}'.format(dyn.getExposure()))
-        print(' -> Exposure Threshold: {:0.4f}'.format(dyn.exposureThresh()))
+        print(' -> Target Exposure: {:0.4f}'.format(r['targetExposure']))
+        print(' -> Current Exposure: {:0.4f}'.format(r['getExposure']))
+        print(' -> Exposure Threshold: {:0.4f}'.format(r['exposureThresh']))
         print('Variable Token Price:')
-        print(' -> Chainlink price: {:0.4f}'.format(dyn.get_variable_price(1)))
-        print(' -> LP price: {:0.4f}'.format(dyn.get_variable_price(2)))
+        print(' -> Chainlink price: {:0.4f}'.format(r['chainlinkPrice']))
+        print(' -> LP price: {:0.4f}'.format(r['lpPrice']))
         
     # Print strategy params
     if params == True:
         print('\nStrategy Params'+ln_break)
         print('Max Allowed Params:')
-        print(' -> Max Collateral Ratio Allowed: {:0.4f}'.format(dyn.maxAllowedCollatRatio()))
-        print(' -> Short Max Exposure Allowed: {:0.4f} , Long Max Exposure Allowed: {:0.4f}'.format(dyn.shortAllowedExposure(), dyn.longAllowedExposure()))
+        print(' -> Max Collateral Ratio Allowed: {:0.4f}'.format(r['maxAllowedCollatRatio']))
+        print(' -> Short Max Exposure Allowed: {:0.4f} , Long Max Exposure Allowed: {:0.4f}'.format(r['shortAllowedExposure'], r['longAllowedExposure']))
         print('Swaps and Fees Params:')
-        print(' -> Swaps Slippage: {:0.2f}%'.format(100*dyn.slippage()/10000))
-        print(' -> Owner Fees: {:0.2f}%'.format(100*dyn.strategistFee()/10000))
-        print(' -> Secondary Asset Fee: {:0.2f}%'.format(100*dyn.secondaryFee()/10000))
-        print(' -> Price Protection Percentage: {:0.2f}%'.format(100*dyn.priceProtectionPerc()))
+        print(' -> Swaps Slippage: {:0.2f}%'.format(100*r['slippage']/10000))
+        print(' -> Owner Fees: {:0.2f}%'.format(100*r['strategistFee']/10000))
+        print(' -> Secondary Asset Fee: {:0.2f}%'.format(100*r['secondaryFee']/10000))
+        print(' -> Price Protection Percentage: {:0.2f}%'.format(100*r['priceProtectionPerc']))
 
 #=====================#    
 # Interact with Strategy 
@@ -243,9 +442,8 @@ action_choices = ['DEPLOY_IDLE','REBALANCE_COLLATERAL','HARVEST','REBALANCE_EXPO
 @gaslimit_option()
 def strategist(context, account, action, address, gasprice, gaslimit):
     _project = context.project_manager
-    _chain = context.chain_manager 
     if address == '':
-        dyn = _chain.contracts.get_deployments(_project.StrategyV1StableVariable)[-1]
+        dyn = latest_deployment(context, 'StrategyV1StableVariable')
     else:
         dyn = _project.StrategyV1StableVariable.at(address)
     
@@ -346,9 +544,8 @@ action_choices = ['SET_OWNER','SET_STRATEGIST','SET_KEEPER','SET_MAX_ALLOWED_CR'
 @gaslimit_option()
 def owner(context, account, action, address, gasprice, gaslimit):
     _project = context.project_manager
-    _chain = context.chain_manager 
     if address == '':
-        dyn = _chain.contracts.get_deployments(_project.StrategyV1StableVariable)[-1]
+        dyn = latest_deployment(context, 'StrategyV1StableVariable')
     else:
         dyn = _project.StrategyV1StableVariable.at(address) 
     
@@ -385,6 +582,181 @@ def owner(context, account, action, address, gasprice, gaslimit):
         dyn.set_max_allowed_exposure(round(Decimal(short_value), 4), round(Decimal(long_value), 4), sender=account, gas_limit=gaslimit, gas_price=gasprice)
         print('\nUpdated max allowed cr: short {:0.4f} , long {:0.4f}\n'.format(dyn.shortAllowedExposure(),dyn.longAllowedExposure()))
 
+#=====================#    
+# Keeper daemon
+#=====================#  
+keeper_reads = ['initialized', 'getCollateralRatio', 'minCollatRatio', 'maxCollatRatio', 'getExposure', 'targetExposure', 'exposureThresh']
+
+def keeper_action(r, harvest_due=False):
+    """
+    Returns the strategy function a keeper should call given the keeper_reads values r (None if no action),
+    with the same checks as the contract. Collateral comes before exposure and exposure before harvest.
+    """
+    if r['initialized'] == False:
+        return None
+    if r['getCollateralRatio'] > r['maxCollatRatio'] or r['getCollateralRatio'] < r['minCollatRatio']:
+        return 'rebalance_collateral'
+    if abs(r['targetExposure'] - r['getExposure']) > r['exposureThresh']:
+        return 'rebalance_exposure'
+    if harvest_due == True:
+        return 'harvest'
+    return None
+
+class KeeperStrategy:
+    """
+    Keeper state of one strategy, the tx task in flight and the backoff after failures.
+    """
+    def __init__(self, dyn):
+        self.dyn = dyn
+        self.task = None
+        self.failures = 0
+        self.retry_at = 0.0
+        self.last_harvest = time.monotonic()
+
+    def ready(self):
+        return (self.task is None or self.task.done()) and time.monotonic() >= self.retry_at
+
+    def failed(self, backoff, max_backoff):
+        self.failures += 1
+        _wait = min(backoff*2**(self.failures-1), max_backoff)
+        self.retry_at = time.monotonic() + _wait
+        return _wait
+
+async def keep_strategies(strategies, account, multicall_addr=multicall_address, poll=2.0, max_inflight=4, harvest_every=None, 
+                          backoff=30.0, max_backoff=900.0, blocks=None, dry_run=False, gasprice=gas_price*10**9, gaslimit=gas_limit):
+    """
+    Checks every ready strategy on each new block and sends the keeper_action txs.
+
+    Reads of all strategies run concurrently, each one a multicall pinned to the new block. Txs are
+    submitted one at a time (one nonce sequence per account) and confirmed concurrently, at most
+    max_inflight at once and one per strategy. A failed read or tx pauses the strategy for backoff
+    seconds, doubled on each consecutive failure up to max_backoff. harvest_every is in seconds.
+    Runs until interrupted, or for blocks new blocks.
+    """
+    import asyncio
+    from ape import networks
+
+    web3 = networks.provider.web3
+    inflight = asyncio.Semaphore(max_inflight)
+    send_lock = asyncio.Lock()
+
+    async def send(s, action):
+        async with inflight:
+            try:
+                async with send_lock:
+                    receipt = await asyncio.to_thread(getattr(s.dyn, action), sender=account, gas_limit=gaslimit, gas_price=gasprice, required_confirmations=0)
+                print('{} {}: sent {}'.format(s.dyn.address, action, receipt.txn_hash))
+                await asyncio.to_thread(receipt.await_confirmations)
+                if receipt.failed == True:
+                    raise Exception('tx {} reverted'.format(receipt.txn_hash))
+            except Exception as e:
+                print('{} {}: failed, retry in {:0.0f}s ({})'.format(s.dyn.address, action, s.failed(backoff, max_backoff), e))
+                return
+            s.failures = 0
+            if action == 'harvest':
+                s.last_harvest = time.monotonic()
+            print('{} {}: confirmed in block {}'.format(s.dyn.address, action, receipt.block_number))
+
+    async def check(s, block):
+        try:
+            r, _ = await asyncio.to_thread(multicall, {k: (s.dyn, k) for k in keeper_reads}, multicall_addr, block)
+            if None in r.values():
+                raise Exception('reverted reads {}'.format([k for k, v in r.items() if v is None]))
+        except Exception as e:
+            print('{}: read failed, retry in {:0.0f}s ({})'.format(s.dyn.address, s.failed(backoff, max_backoff), e))
+            return
+        _harvest_due = harvest_every is not None and time.monotonic() - s.last_harvest >= harvest_every
+        action = keeper_action(r, _harvest_due)
+        if action is None or dry_run == True:
+            # Healthy with no tx to send, a tx that keeps failing only resets once it confirms
+            s.failures = 0
+        if action is None:
+            return
+        print('Block {} {}: {} (CR {:0.4f} in [{:0.4f}, {:0.4f}], exposure {:0.4f} target {:0.4f} +- {:0.4f})'.format(
+            block, s.dyn.address, action, r['getCollateralRatio'], r['minCollatRatio'], r['maxCollatRatio'], 
+            r['getExposure'], r['targetExposure'], r['exposureThresh']))
+        if dry_run == True:
+            if action == 'harvest':
+                s.last_harvest = time.monotonic()
+            return
+        s.task = asyncio.create_task(send(s, action))
+
+    last_block = None
+    n_blocks = 0
+    while blocks is None or n_blocks < blocks:
+        block = await asyncio.to_thread(lambda: web3.eth.block_number)
+        if block != last_block:
+            last_block = block
+            n_blocks += 1
+            await asyncio.gather(*[check(s, block) for s in strategies if s.ready()])
+        if blocks is None or n_blocks < blocks:
+            await asyncio.sleep(poll)
+
+    # Wait for the txs still in flight
+    await asyncio.gather(*[s.task for s in strategies if s.task is not None])
+
+@cli.command(cls=NetworkCommand)
+@ape_cli_context()
+@account_option()
+@click.option('-address', 'addresses', type=click.STRING, multiple=True, help="Strategy to keep, repeat for more (defaults to every deployed strategy)")
+@click.option('--multicall', 'multicall_addr', type=click.STRING, default=multicall_address, show_default=True, help="Multicall3 compatible contract used to batch reads")
+@click.option('--poll', type=click.FLOAT, default=2.0, show_default=True, help="Seconds between checks for a new block")
+@click.option('--max-inflight', type=click.INT, default=4, show_default=True, help="Max txs waiting for confirmation")
+@click.option('--harvest-every', type=click.FLOAT, default=None, help="Hours between harvests of each strategy (no harvests if not set)")
+@click.option('--backoff', type=click.FLOAT, default=30, show_default=True, help="Seconds a strategy is paused after a failure, doubled on each consecutive one")
+@click.option('--max-backoff', type=click.FLOAT, default=900, show_default=True, help="Max seconds a strategy is paused")
+@click.option('--blocks', type=click.INT, default=None, help="Stop after this many new blocks (runs until interrupted if not set)")
+@click.option("--dry-run", is_flag=True, help="Only print the actions")
+@gasprice_option()
+@gaslimit_option()
+def keeper(context, account, addresses, multicall_addr, poll, max_inflight, harvest_every, backoff, max_backoff, blocks, dry_run, gasprice, gaslimit):
+    import asyncio
+    _project = context.project_manager
+    if len(addresses) == 0:
+        _deployed = context.chain_manager.contracts.get_deployments(_project.StrategyV1StableVariable)
+    else:
+        _deployed = [_project.StrategyV1StableVariable.at(a) for a in addresses]
+    
+    # Check if account has keeper or strategist role
+    strategies = []
+    for dyn in _deployed:
+        if dyn.keepers(account) == False and dyn.strategists(account) == False:
+            print('Skipping {}: account is not a keeper or strategist'.format(dyn.address))
+            continue
+        strategies.append(KeeperStrategy(dyn))
+    if len(strategies) == 0:
+        click.echo("\nERROR - No strategy to keep")
+        raise click.Abort()
+    
+    print('Keeping {} strategies'.format(len(strategies))+ln_break)
+    _harvest_every = None if harvest_every is None else harvest_every*3600
+    try:
+        asyncio.run(keep_strategies(strategies, account, multicall_addr, poll, max_inflight, _harvest_every, backoff, max_backoff, blocks, 
+                                    dry_run, gasprice, gaslimit))
+    except KeyboardInterrupt:
+        print('\nKeeper stopped')
+
+#=====================#    
+# Metadata cache
+#=====================#  
+@cli.group()
+def cache():
+    """Show or clear the cached contract metadata."""
+
+@cache.command('show')
+def cache_show():
+    print('Cache file: {}'.format(metadata.path)+ln_break)
+    for _chain, contracts in metadata.data.items():
+        print('Chain {}:'.format(_chain))
+        for _address, values in contracts.items():
+            print(' -> {}: {}'.format(_address, values))
+
+@cache.command('clear')
+@click.option('--chain-id', type=click.INT, default=None, help="Only clear this chain")
+@click.option('-address', type=click.STRING, default=None, help="Only clear this contract ('deployments' for the deployment addresses)")
+def cache_clear(chain_id, address):
+    removed = metadata.clear(chain_id, address)
+    print('Removed {} cached contracts from {}'.format(removed, metadata.path))
 
 
 if __name__ == "__main__":
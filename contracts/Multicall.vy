@@ -0,0 +1,27 @@
+# @version ^0.3.7
+"""
+@title Multicall
+@notice Batches view calls into one eth_call, same aggregate3 interface as Multicall3.
+        Only needed on networks without Multicall3 (e.g. local test networks).
+"""
+
+struct Call3:
+    target: address
+    allowFailure: bool
+    callData: Bytes[1024]
+
+struct Result:
+    success: bool
+    returnData: Bytes[1024]
+
+@view
+@external
+def aggregate3(calls: DynArray[Call3, 128]) -> DynArray[Result, 128]:
+    results: DynArray[Result, 128] = []
+    for c in calls:
+        success: bool = False
+        response: Bytes[1024] = b""
+        success, response = raw_call(c.target, c.callData, max_outsize=1024, is_static_call=True, revert_on_failure=False)
+        assert success or c.allowFailure, "multicall: call failed"
+        results.append(Result({success: success, returnData: response}))
+    return results